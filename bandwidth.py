@@ -0,0 +1,124 @@
+import re
+import time
+import heapq
+import itertools
+import threading
+
+# 優先順序：單一影片（使用者正在等）先於背景播放清單
+# Priorities: a single video the user is waiting on goes ahead of playlist syncs
+PRIORITY_INTERACTIVE = 10
+PRIORITY_BACKGROUND = 0
+
+# 令牌桶最多累積幾秒的流量
+# How many seconds of traffic the token bucket may save up
+BURST_SECONDS = 1.0
+# 等待中的傳輸至少每隔這麼久重新檢查一次速率（時段可能已切換）
+# Waiting transfers re-check the rate at least this often, as the schedule may have changed
+MAX_WAIT = 1.0
+
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_rate(text):
+    """Parse ``500K``, ``2M``, ``1.5M`` or a plain byte count into bytes per second.
+
+    ``0``, ``off`` and ``unlimited`` mean no limit and return None.
+    """
+    text = text.strip().upper()
+    if text in ('', '0', 'OFF', 'UNLIMITED'):
+        return None
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([KMG]?)I?B?(?:/S)?', text)
+    if not match:
+        raise ValueError(f"Invalid rate: {text}")
+    rate = int(float(match.group(1)) * UNITS[match.group(2)])
+    return rate or None
+
+
+def parse_window(text):
+    """Parse ``HH:MM-HH:MM=RATE`` into ``(start_minute, end_minute, rate)``.
+
+    A window whose end is before its start runs past midnight.
+    """
+    match = re.fullmatch(r'\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\S+)\s*', text)
+    if not match:
+        raise ValueError(f"Invalid schedule window: {text}")
+    h1, m1, h2, m2 = (int(match.group(i)) for i in range(1, 5))
+    if h1 > 24 or h2 > 24 or m1 > 59 or m2 > 59:
+        raise ValueError(f"Invalid schedule window: {text}")
+    return h1 * 60 + m1, h2 * 60 + m2, parse_rate(match.group(5))
+
+
+class BandwidthScheduler:
+    """Global token bucket shared by every transfer of the downloader.
+
+    Each transfer calls ``acquire`` with the size of the chunk it just read.
+    Waiting transfers are served highest priority first and in arrival order
+    within a priority; since a stream queues again after every chunk, streams of
+    the same priority take turns and split the bandwidth evenly. With no limit
+    in force ``acquire`` returns straight away.
+
+    ``schedule`` is a list of ``(start_minute, end_minute, rate)`` windows in
+    local time, e.g. from ``parse_window``; outside them ``rate`` applies. A
+    rate of None means unlimited.
+    """
+
+    def __init__(self, rate=None, schedule=()):
+        self.default_rate = rate
+        self.schedule = list(schedule)
+        self.cond = threading.Condition()
+        self.waiters = []
+        self.tickets = itertools.count()
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+
+    def rate_now(self):
+        now = time.localtime()
+        minute = now.tm_hour * 60 + now.tm_min
+        for start, end, rate in self.schedule:
+            if start <= minute < end or (end < start and (minute >= start or minute < end)):
+                return rate
+        return self.default_rate
+
+    def limiter(self, priority=PRIORITY_BACKGROUND):
+        """Return a ``throttle(n)`` callback for one transfer at ``priority``."""
+        return lambda n: self.acquire(n, priority)
+
+    def acquire(self, n, priority=PRIORITY_BACKGROUND):
+        """Block until ``n`` bytes may be transferred."""
+        if self.rate_now() is None and not self.waiters:
+            return
+        with self.cond:
+            ticket = (-priority, next(self.tickets))
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    rate = self.rate_now()
+                    self.refill(rate)
+                    if self.waiters[0] == ticket:
+                        if rate is None:
+                            break
+                        # 大於桶容量的區塊先讓令牌存滿，再以欠額方式放行
+                        # A chunk larger than the bucket goes once it is full, leaving a debt
+                        need = min(n, self.capacity(rate))
+                        if self.tokens >= need:
+                            self.tokens -= n
+                            break
+                        timeout = min((need - self.tokens) / rate, MAX_WAIT)
+                    else:
+                        timeout = MAX_WAIT
+                    self.cond.wait(timeout)
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.cond.notify_all()
+
+    def capacity(self, rate):
+        return max(rate * BURST_SECONDS, 1)
+
+    def refill(self, rate):
+        now = time.monotonic()
+        if rate is None:
+            self.tokens = 0.0
+        else:
+            self.tokens = min(self.tokens + (now - self.updated) * rate, self.capacity(rate))
+        self.updated = now
@@ -0,0 +1,365 @@
+"""Offline benchmark of the download paths.
+
+Usage:
+    python benchmark.py [--size-mb 8] [--duration 10] [--latency-ms 50] [--bandwidth 50M]
+                        [--playlist 4] [--workers 4] [--scenarios single,adaptive,mp3,playlist,thumbnail]
+                        [--ffmpeg PATH] [--json results.json]
+
+A local fixture server stands in for YouTube and googlevideo: it serves
+synthetic progressive and adaptive streams generated with ffmpeg, and thumbnail
+images, with configurable size, first-byte latency and per-connection
+bandwidth. ``pytubefix.YouTube`` and ``Playlist`` are replaced by stand-ins
+that point at it, so nothing touches the network. Each scenario runs end to end
+through ``DownloadEngine`` in its own process, which keeps peak RSS figures
+separate, and reports throughput, time to first byte, mux time and peak RSS.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.server
+from urllib.parse import urlparse
+
+SCENARIOS = ['single', 'adaptive', 'mp3', 'playlist', 'thumbnail']
+CHUNK_SIZE = 64 * 1024
+# 串流網址的到期時間設得很遠，避免快取在測試中途失效
+# Stream URLs expire far in the future so the metadata cache never drops them mid-run
+EXPIRE = 4102444800
+
+# 合成媒體：檔名、ffmpeg 參數與對應的 pytubefix 串流屬性
+# Synthetic media: file name, ffmpeg arguments and the matching pytubefix stream fields
+VIDEO_FILTER = 'testsrc2=size={size}:rate=30,noise=alls=60:allf=t'
+MEDIA = {
+    'progressive.mp4': {
+        'inputs': ['-f', 'lavfi', '-i', VIDEO_FILTER.format(size='640x360'),
+                   '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100'],
+        'codecs': ['-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-b:a', '128k'],
+        'stream': dict(itag=18, mime_type='video/mp4', type='video', subtype='mp4',
+                       resolution='360p', abr='128kbps', video_codec='avc1.42001E',
+                       audio_codec='mp4a.40.2', is_progressive=True),
+    },
+    'video.mp4': {
+        'inputs': ['-f', 'lavfi', '-i', VIDEO_FILTER.format(size='1280x720')],
+        'codecs': ['-c:v', 'libx264', '-preset', 'ultrafast', '-an'],
+        'stream': dict(itag=136, mime_type='video/mp4', type='video', subtype='mp4',
+                       resolution='720p', abr=None, video_codec='avc1.4d401f',
+                       audio_codec=None, is_progressive=False),
+    },
+    'audio.m4a': {
+        'inputs': ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100'],
+        'codecs': ['-c:a', 'aac', '-b:a', '128k', '-vn'],
+        'stream': dict(itag=140, mime_type='audio/mp4', type='audio', subtype='mp4',
+                       resolution=None, abr='128kbps', video_codec=None,
+                       audio_codec='mp4a.40.2', is_progressive=False),
+    },
+}
+
+
+def build_media(ffmpeg_path, media_dir, size_mb, duration):
+    """Generate the fixture media once; video bitrates are set to hit ``size_mb``."""
+    os.makedirs(media_dir, exist_ok=True)
+    bitrate = f"{int(size_mb * 8 * 1024 / duration)}k"
+    for name, spec in MEDIA.items():
+        path = os.path.join(media_dir, name)
+        if os.path.exists(path):
+            continue
+        rate = [] if name == 'audio.m4a' else ['-b:v', bitrate, '-maxrate', bitrate, '-bufsize', bitrate]
+        subprocess.run(
+            [ffmpeg_path, '-hide_banner', '-loglevel', 'error', *spec['inputs'], '-t', str(duration),
+             *spec['codecs'], *rate, '-movflags', '+faststart', '-y', path],
+            check=True
+        )
+    thumbnail = os.path.join(media_dir, 'thumbnail.jpg')
+    if not os.path.exists(thumbnail):
+        subprocess.run(
+            [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-f', 'lavfi',
+             '-i', 'testsrc2=size=480x360', '-frames:v', '1', '-y', thumbnail],
+            check=True
+        )
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """Serves ``/videoplayback/<file>`` with Range support and ``/vi/<id>/hqdefault.jpg``."""
+
+    media_dir = None
+    latency = 0.0
+    bandwidth = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith('/vi/'):
+            name = 'thumbnail.jpg'
+        elif path.startswith('/videoplayback/'):
+            name = os.path.basename(path)
+        else:
+            name = None
+        file_path = os.path.join(self.media_dir, name) if name else None
+        if not file_path or not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(file_path)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        time.sleep(self.latency)
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else end, size - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        with open(file_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            began = time.monotonic()
+            sent = 0
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(chunk)
+                sent += len(chunk)
+                # 每條連線各自限速，模擬 googlevideo 的單連線頻寬
+                # Each connection is paced on its own, like googlevideo's per-connection rate
+                if self.bandwidth:
+                    delay = sent / self.bandwidth - (time.monotonic() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+
+
+def start_fixture_server(media_dir, latency, bandwidth):
+    handler = type('Handler', (FixtureHandler,), {
+        'media_dir': media_dir, 'latency': latency, 'bandwidth': bandwidth,
+    })
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fake_pytubefix(base_url, playlist_length):
+    """Return ``(YouTube, Playlist)`` stand-ins whose streams live on the fixture server."""
+    from metadata_cache import video_id_from_url
+
+    class FakeStream:
+        def __init__(self, video_id, name, spec, filesize):
+            for key, value in spec.items():
+                setattr(self, key, value)
+            self.url = f"{base_url}/videoplayback/{name}?id={video_id}&expire={EXPIRE}"
+            self._filesize = filesize
+
+    class FakeYouTube:
+        def __init__(self, url, *args, **kwargs):
+            self.video_id = video_id_from_url(url)
+            self.title = f"Benchmark {self.video_id}"
+            self.thumbnail_url = f"{base_url}/vi/{self.video_id}/hqdefault.jpg"
+            media_dir = FixtureHandler.media_dir
+            self.streams = [
+                FakeStream(self.video_id, name, spec['stream'],
+                           os.path.getsize(os.path.join(media_dir, name)) if media_dir else None)
+                for name, spec in MEDIA.items()
+            ]
+
+    class FakePlaylist:
+        def __init__(self, url, *args, **kwargs):
+            self.playlist_url = url
+
+        def url_generator(self):
+            for n in range(playlist_length):
+                yield f"https://www.youtube.com/watch?v=bench{n:06d}"
+
+    return FakeYouTube, FakePlaylist
+
+
+def peak_rss_mb():
+    """Return ``(this process, largest child)`` peak RSS in MB, or Nones where unsupported."""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # macOS 以位元組回報，Linux 以 KB 回報
+    # macOS reports bytes, Linux reports kilobytes
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    )
+
+
+def run_scenario(name, base_url, media_dir, work_dir, ffmpeg_path, playlist_length, workers):
+    """Run one scenario in this process and return its measurements."""
+    import engine
+    import metadata_cache
+    from progress_bus import ProgressBus
+
+    FixtureHandler.media_dir = media_dir
+    FakeYouTube, FakePlaylist = fake_pytubefix(base_url, playlist_length)
+    metadata_cache.YouTube = FakeYouTube
+    engine.Playlist = FakePlaylist
+
+    out_dir = os.path.join(work_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+    bus = ProgressBus()
+    eng = engine.DownloadEngine(ffmpeg_path, bus=bus, data_dir=os.path.join(work_dir, 'data'))
+    url = "https://www.youtube.com/watch?v=benchsingle"
+    started = time.monotonic()
+    try:
+        if name == 'single':
+            eng.download_single_video(url, out_dir, 'mp4', '360p')
+        elif name == 'adaptive':
+            eng.download_single_video(url, out_dir, 'mp4', '720p')
+        elif name == 'mp3':
+            eng.download_single_video(url, out_dir, 'mp3')
+        elif name == 'playlist':
+            _, failed, _ = eng.download_playlist(
+                "https://www.youtube.com/playlist?list=benchmark", out_dir, 'mp4', workers
+            )
+            if failed:
+                raise RuntimeError(f"{failed} playlist item(s) failed")
+        elif name == 'thumbnail':
+            from thumbnail_cache import ThumbnailCache
+            thumbnails = ThumbnailCache(os.path.join(work_dir, 'thumbnails'))
+            thumbnails.submit('benchsingle', lambda: eng.metadata.get(url).thumbnail_url).result()
+        else:
+            raise ValueError(f"Unknown scenario: {name}")
+    finally:
+        eng.shutdown()
+    wall = time.monotonic() - started
+
+    events, _ = bus.drain()
+    jobs = [event for event in events if event['kind'] == 'job_finished']
+    total_bytes = sum(job['bytes'] for job in jobs)
+    ttfbs = [job['ttfb'] for job in jobs if job['ttfb'] is not None]
+    rss, child_rss = peak_rss_mb()
+    return {
+        'scenario': name,
+        'ok': all(job['ok'] for job in jobs),
+        'wall_s': wall,
+        'bytes': total_bytes,
+        'throughput_mb_s': total_bytes / wall / (1024 * 1024) if wall else 0.0,
+        'ttfb_ms': 1000 * sum(ttfbs) / len(ttfbs) if ttfbs else None,
+        'mux_s': sum(job['stages'].get('mux', 0.0) + job['stages'].get('transcode', 0.0)
+                     for job in jobs),
+        'peak_rss_mb': rss,
+        'ffmpeg_peak_rss_mb': child_rss,
+    }
+
+
+def find_ffmpeg():
+    from common import user_data_dir
+    exe_name = "ffmpeg.exe" if os.name == "nt" else "ffmpeg"
+    bundled = os.path.join(user_data_dir, exe_name)
+    return bundled if os.path.exists(bundled) else shutil.which('ffmpeg')
+
+
+def print_table(results):
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else format('-', re.sub(r'\.\d+f', '', spec))
+    print(f"{'scenario':<10} {'ok':<3} {'wall s':>7} {'MB':>7} {'MB/s':>7} {'TTFB ms':>8} "
+          f"{'mux s':>6} {'RSS MB':>7} {'ffmpeg MB':>9}")
+    for r in results:
+        print(
+            f"{r['scenario']:<10} {'yes' if r['ok'] else 'no':<3} {r['wall_s']:>7.2f} "
+            f"{r['bytes'] / (1024 * 1024):>7.1f} {r['throughput_mb_s']:>7.1f} "
+            f"{fmt(r['ttfb_ms'], '>8.0f')} {r['mux_s']:>6.2f} "
+            f"{fmt(r['peak_rss_mb'], '>7.1f')} {fmt(r['ffmpeg_peak_rss_mb'], '>9.1f')}"
+        )
+
+
+def build_parser():
+    from bandwidth import parse_rate
+    parser = argparse.ArgumentParser(description="Benchmark the download paths against a local fixture server.")
+    parser.add_argument('--size-mb', type=float, default=8, help="approximate size of each video stream")
+    parser.add_argument('--duration', type=int, default=10, help="length of the synthetic media in seconds")
+    parser.add_argument('--latency-ms', type=float, default=50, help="delay before each response")
+    parser.add_argument('--bandwidth', type=parse_rate, default=None,
+                        help="per-connection server speed, e.g. 20M (default: unlimited)")
+    parser.add_argument('--playlist', type=int, default=4, help="number of videos in the playlist scenario")
+    parser.add_argument('--workers', type=int, default=4, help="playlist workers")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument('--ffmpeg', help="ffmpeg binary (default: the app's copy, then PATH)")
+    parser.add_argument('--media-dir', help="keep generated media here between runs")
+    parser.add_argument('--json', help="also write the results to this file")
+    # 內部使用：在子行程中執行單一情境
+    # Internal: run a single scenario in a child process
+    parser.add_argument('--run-scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    ffmpeg_path = args.ffmpeg or find_ffmpeg()
+    if not ffmpeg_path:
+        print("FFmpeg not found; pass --ffmpeg.", file=sys.stderr)
+        return 1
+
+    if args.run_scenario:
+        result = run_scenario(
+            args.run_scenario, args.base_url, args.media_dir, args.work_dir,
+            ffmpeg_path, args.playlist, args.workers
+        )
+        print(json.dumps(result))
+        return 0
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='ytdl-bench-') as tmp:
+        media_dir = args.media_dir or os.path.join(tmp, 'media')
+        print("Generating fixture media...")
+        build_media(ffmpeg_path, media_dir, args.size_mb, args.duration)
+        server = start_fixture_server(media_dir, args.latency_ms / 1000, args.bandwidth)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            for name in scenarios:
+                work_dir = os.path.join(tmp, name)
+                proc = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--run-scenario', name,
+                     '--base-url', base_url, '--media-dir', media_dir, '--work-dir', work_dir,
+                     '--ffmpeg', ffmpeg_path, '--playlist', str(args.playlist),
+                     '--workers', str(args.workers)],
+                    stdout=subprocess.PIPE, text=True
+                )
+                lines = proc.stdout.strip().splitlines()
+                if proc.returncode != 0 or not lines:
+                    print(f"Scenario {name} failed (exit code {proc.returncode})", file=sys.stderr)
+                    results.append({'scenario': name, 'ok': False, 'wall_s': 0.0, 'bytes': 0,
+                                    'throughput_mb_s': 0.0, 'ttfb_ms': None, 'mux_s': 0.0,
+                                    'peak_rss_mb': None, 'ffmpeg_peak_rss_mb': None})
+                    continue
+                results.append(json.loads(lines[-1]))
+        finally:
+            server.shutdown()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'settings': {
+                'size_mb': args.size_mb, 'duration': args.duration, 'latency_ms': args.latency_ms,
+                'bandwidth': args.bandwidth, 'playlist': args.playlist, 'workers': args.workers,
+            }, 'results': results}, f, indent=2)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""Headless batch downloader.
+
+Usage:
+    python cli.py -o OUTPUT [-i URLS_FILE] [-f mp4|webm|mp3] [-r 720p] [-w 4]
+                  [--limit-rate 5M] [--schedule 09:00-18:00=1M ...] [URL ...]
+
+Only the download engine is imported here, never tkinter or PIL, so this runs on
+machines without a display and starts quickly.
+"""
+import os
+import sys
+import argparse
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import http_client
+from bandwidth import BandwidthScheduler, parse_rate, parse_window
+from common import (
+    FFMPEG_PATH, FORMATS, DEFAULT_PLAYLIST_WORKERS, MAX_PLAYLIST_WORKERS,
+    bootstrap_ffmpeg, is_playlist_url, log_error,
+)
+from engine import DownloadEngine
+from progress_bus import format_bytes, format_eta
+
+REPORT_INTERVAL = 2.0
+
+
+def read_urls(path):
+    """Read one URL per line; blank lines and lines starting with # are skipped."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.strip().startswith('#')
+        ]
+
+
+def report_progress(bus, stop):
+    """Print a progress line every REPORT_INTERVAL seconds until ``stop`` is set."""
+    playlist = None
+    while not stop.wait(REPORT_INTERVAL):
+        events, jobs = bus.drain()
+        for event in events:
+            if event['kind'] == 'playlist_progress':
+                playlist = (event['done'], event['total'])
+            elif event['kind'] == 'playlist_finished':
+                playlist = None
+            elif event['kind'] == 'message':
+                print(event.get('text', event.get('key')))
+        if not jobs:
+            continue
+        etas = [job['eta'] for job in jobs if job['eta'] is not None]
+        line = (
+            f"{len(jobs)} active, {format_bytes(sum(job['bytes_per_sec'] for job in jobs))}/s, "
+            f"ETA {format_eta(max(etas) if etas else None)}"
+        )
+        if playlist:
+            line = f"[{playlist[0]}/{playlist[1]}] " + line
+        print(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Download YouTube videos and playlists without the GUI.")
+    parser.add_argument('urls', nargs='*', help="video or playlist URLs")
+    parser.add_argument('-i', '--input', help="file with one video or playlist URL per line")
+    parser.add_argument('-o', '--output', required=True, help="download folder")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='mp4')
+    parser.add_argument(
+        '-r', '--resolution', default='best',
+        help="resolution for single videos, e.g. 720p (default: best available)"
+    )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=DEFAULT_PLAYLIST_WORKERS,
+        help=f"videos downloaded at the same time, 1-{MAX_PLAYLIST_WORKERS}"
+    )
+    parser.add_argument(
+        '--limit-rate', type=parse_rate, default=None, metavar='RATE',
+        help="total download speed limit, e.g. 500K or 2M bytes per second (default: unlimited)"
+    )
+    parser.add_argument(
+        '--schedule', type=parse_window, action='append', default=[], metavar='HH:MM-HH:MM=RATE',
+        help="speed limit for a daily time window, e.g. 09:00-18:00=1M; may be repeated"
+    )
+    parser.add_argument(
+        '--pool-size', type=int, default=http_client.DEFAULT_POOL_SIZE,
+        help=f"keep-alive connections per host (default: {http_client.DEFAULT_POOL_SIZE})"
+    )
+    parser.add_argument(
+        '--timeout', type=float, default=http_client.DEFAULT_TIMEOUT[1],
+        help=f"network read timeout in seconds (default: {http_client.DEFAULT_TIMEOUT[1]})"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    urls = list(args.urls)
+    if args.input:
+        urls.extend(read_urls(args.input))
+    if not urls:
+        print("No URLs given.", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+    http_client.configure(
+        pool_size=args.pool_size, timeout=(http_client.DEFAULT_TIMEOUT[0], args.timeout)
+    )
+
+    # 下載不必等 FFmpeg 安裝完成，只有轉檔與合併會等待
+    # Downloads start while FFmpeg installs; only muxing and transcoding wait for it
+    engine = DownloadEngine(
+        FFMPEG_PATH, bandwidth=BandwidthScheduler(args.limit_rate, args.schedule),
+        ffmpeg_ready=bootstrap_ffmpeg(), ffmpeg_bootstrap=bootstrap_ffmpeg
+    )
+    stop = threading.Event()
+    reporter = threading.Thread(target=report_progress, args=(engine.bus, stop), daemon=True)
+    reporter.start()
+    failed = 0
+    videos = [url for url in urls if not is_playlist_url(url)]
+    playlists = [url for url in urls if is_playlist_url(url)]
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(args.workers, MAX_PLAYLIST_WORKERS))) as pool:
+            futures = {
+                pool.submit(
+                    engine.download_single_video, url, args.output, args.format, args.resolution
+                ): url
+                for url in videos
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    print(f"Downloaded {url} -> {future.result()}")
+                except Exception as e:
+                    failed += 1
+                    log_error(f"Failed to download video {url}: {str(e)}\n{traceback.format_exc()}")
+                    print(f"Failed {url}: {e}", file=sys.stderr)
+
+        for url in playlists:
+            print(f"Playlist {url}")
+            try:
+                _, playlist_failed, _ = engine.download_playlist(
+                    url, args.output, args.format, workers=args.workers
+                )
+                failed += playlist_failed
+            except Exception as e:
+                failed += 1
+                log_error(f"Failed to download playlist {url}: {str(e)}\n{traceback.format_exc()}")
+                print(f"Failed {url}: {e}", file=sys.stderr)
+    finally:
+        stop.set()
+        engine.shutdown()
+
+    print(f"Finished with {failed} failure(s).")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
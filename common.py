@@ -0,0 +1,79 @@
+import os
+import re
+import sys
+import time
+import threading
+from concurrent.futures import Future
+
+import appdirs
+
+APP_NAME = "YouTubeDownloader"
+APP_AUTHOR = "NYCU_SDC_B"
+
+base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
+
+# 使用 appdirs 取得系統專屬持久化資料夾
+# Use appdirs to get the system-specific persistent data folder
+user_data_dir = appdirs.user_data_dir(APP_NAME, APP_AUTHOR)
+if not os.path.exists(user_data_dir):
+    os.makedirs(user_data_dir)
+
+# 紀錄資料夾在第一次寫入時才建立
+# The logs folder is only created once something is written to it
+LOGS_DIR = os.path.join(base_path, "logs")
+
+FFMPEG_PATH = os.path.join(user_data_dir, "ffmpeg.exe" if os.name == "nt" else "ffmpeg")
+
+ERROR_LOG_PATH = os.path.join(LOGS_DIR, "YouTubeDownloader_errors.log")
+# 每個下載工作一行 JSON：速度、各階段耗時等
+# One JSON line per download job: throughput, stage timings and so on
+METRICS_PATH = os.path.join(LOGS_DIR, "YouTubeDownloader_metrics.jsonl")
+STARTUP_PROFILE_PATH = os.path.join(LOGS_DIR, "YouTubeDownloader_startup.txt")
+
+# 介面與下載核心共用的設定，放在這裡讓介面不必先載入下載核心
+# Settings shared by the UI and the engine, kept here so the UI can draw
+# without importing the engine first
+FORMATS = ['mp4', 'webm', 'mp3']
+
+# 播放清單同時下載的影片數量
+# Number of playlist videos downloaded at the same time
+DEFAULT_PLAYLIST_WORKERS = 4
+MAX_PLAYLIST_WORKERS = 8
+
+
+def bootstrap_ffmpeg():
+    """Return a Future for ``FFMPEG_PATH``, installing ffmpeg in the background if needed.
+
+    When ffmpeg is already in place the Future is done on return, so callers
+    such as the GUI can start right away either way.
+    """
+    import download_ffmpeg
+    future = Future()
+    if download_ffmpeg.is_installed(FFMPEG_PATH):
+        future.set_result(FFMPEG_PATH)
+        return future
+
+    def run():
+        try:
+            future.set_result(download_ffmpeg.ensure(user_data_dir))
+        except Exception as e:
+            log_error(f"Error occurred while downloading FFmpeg: {str(e)}")
+            future.set_exception(e)
+
+    print("FFmpeg not found, downloading it in the background.")
+    threading.Thread(target=run, name='ffmpeg-bootstrap', daemon=True).start()
+    return future
+
+
+def is_playlist_url(url):
+    return "playlist?" in url or "&list=" in url
+
+
+def sanitize_filename(name):
+    return re.sub(r'[\\/*?"<>|]', "", name)
+
+
+def log_error(message):
+    os.makedirs(LOGS_DIR, exist_ok=True)
+    with open(ERROR_LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
@@ -0,0 +1,45 @@
+import os
+import time
+import sqlite3
+import threading
+
+
+class DownloadArchive:
+    """Record of finished downloads, so re-syncs skip them without any network call.
+
+    Rows are keyed by video ID, format, resolution and download folder; the
+    primary key doubles as the on-disk lookup index.
+    """
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS archive ("
+                " video_id TEXT NOT NULL, fmt TEXT NOT NULL, resolution TEXT NOT NULL,"
+                " folder TEXT NOT NULL, path TEXT NOT NULL, downloaded_at REAL NOT NULL,"
+                " PRIMARY KEY (video_id, fmt, resolution, folder))"
+            )
+
+    def contains(self, video_id, fmt, resolution, folder):
+        """True if this video was downloaded into ``folder`` and is still there."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT path FROM archive"
+                " WHERE video_id = ? AND fmt = ? AND resolution = ? AND folder = ?",
+                (video_id, fmt, resolution, os.path.abspath(folder))
+            ).fetchone()
+        return row is not None and os.path.exists(row[0])
+
+    def add(self, video_id, fmt, resolution, path):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO archive VALUES (?, ?, ?, ?, ?, ?)",
+                (video_id, fmt, resolution, os.path.dirname(os.path.abspath(path)),
+                 os.path.abspath(path), time.time())
+            )
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -1,68 +1,272 @@
 import os
 import sys
+import json
+import zlib
+import struct
+import hashlib
 import platform
-import zipfile
 import tarfile
-import requests
 import shutil
 
-def download_file(url, dest):
-    with requests.get(url, stream=True) as r:
+import http_client
+
+# 各平台的下載來源、壓縮格式與壓縮檔中的執行檔名稱
+# Download source, archive type and binary name inside the archive, per platform
+SOURCES = {
+    "Windows": ("https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip", "zip", "ffmpeg.exe"),
+    "Darwin": ("https://evermeet.cx/ffmpeg/ffmpeg-6.1.1.zip", "zip", "ffmpeg"),
+    "Linux": ("https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz", "tar.xz", "ffmpeg"),
+}
+CHUNK_SIZE = 1024 * 1024
+
+ZIP_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+ZIP_LOCAL_SIGNATURE = 0x04034b50
+ZIP_DESCRIPTOR_SIGNATURE = 0x08074b50
+
+
+class BootstrapError(Exception):
+    pass
+
+
+class StreamReader:
+    """Front-to-back reader over a file-like object that can push bytes back."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.buffer = b""
+
+    def read(self, n):
+        while len(self.buffer) < n:
+            chunk = self.raw.read(max(n - len(self.buffer), CHUNK_SIZE))
+            if not chunk:
+                break
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    def read_exact(self, n):
+        data = self.read(n)
+        if len(data) != n:
+            raise BootstrapError("Archive ended unexpectedly")
+        return data
+
+    def skip(self, n):
+        while n > 0:
+            n -= len(self.read_exact(min(n, CHUNK_SIZE)))
+
+    def unread(self, data):
+        self.buffer = data + self.buffer
+
+
+class HashingWriter:
+    """Write-through file wrapper that keeps a SHA-256 of everything written."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.f.write(data)
+
+
+def extract_from_tar_stream(raw, name, out):
+    """Copy the first regular file called ``name`` from a streamed .tar.xz into ``out``.
+
+    The archive is read strictly in order and reading stops at the binary, so
+    the rest of the download is never fetched.
+    """
+    with tarfile.open(fileobj=raw, mode="r|xz") as tar:
+        for member in tar:
+            if member.isfile() and os.path.basename(member.name) == name:
+                shutil.copyfileobj(tar.extractfile(member), out, CHUNK_SIZE)
+                return True
+    return False
+
+
+def extract_from_zip_stream(raw, name, out):
+    """Copy the first entry called ``name`` from a streamed zip into ``out``.
+
+    ``zipfile`` needs a seekable file, so this walks the local file headers from
+    the front instead of reading the central directory at the end. Stored and
+    deflated entries are supported, with or without trailing data descriptors.
+    """
+    reader = StreamReader(raw)
+    while True:
+        header = reader.read(ZIP_LOCAL_HEADER.size)
+        if len(header) < ZIP_LOCAL_HEADER.size:
+            return False
+        (signature, _, flags, method, _, _, crc, compressed_size, _, name_len,
+         extra_len) = ZIP_LOCAL_HEADER.unpack(header)
+        if signature != ZIP_LOCAL_SIGNATURE:
+            # 已到中央目錄，沒有更多檔案
+            # Reached the central directory: no more entries
+            return False
+        entry_name = reader.read_exact(name_len).decode("utf-8", "replace")
+        reader.skip(extra_len)
+        has_descriptor = bool(flags & 0x08)
+        wanted = os.path.basename(entry_name) == name and not entry_name.endswith("/")
+        if method not in (0, 8):
+            if wanted:
+                raise BootstrapError(f"Unsupported zip compression method {method}")
+            if has_descriptor:
+                raise BootstrapError("Cannot skip an entry of unknown size")
+            reader.skip(compressed_size)
+            continue
+        if not wanted and not has_descriptor:
+            reader.skip(compressed_size)
+            continue
+        if method == 0 and has_descriptor:
+            raise BootstrapError("Cannot stream a stored zip entry of unknown size")
+        sink = out if wanted else None
+        actual_crc = copy_zip_entry(reader, method, compressed_size, has_descriptor, sink)
+        if has_descriptor:
+            crc = read_zip_descriptor(reader)
+        if wanted:
+            if actual_crc != crc:
+                raise BootstrapError(f"CRC mismatch for {entry_name}")
+            return True
+
+
+def copy_zip_entry(reader, method, compressed_size, has_descriptor, sink):
+    """Decompress one entry into ``sink`` (or nowhere) and return its CRC-32."""
+    crc = 0
+    remaining = None if has_descriptor else compressed_size
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == 8 else None
+    while remaining is None or remaining > 0:
+        chunk = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+        if not chunk:
+            raise BootstrapError("Archive ended unexpectedly")
+        if remaining is not None:
+            remaining -= len(chunk)
+        data = decompressor.decompress(chunk) if decompressor else chunk
+        crc = zlib.crc32(data, crc)
+        if sink is not None:
+            sink.write(data)
+        if decompressor and decompressor.eof:
+            # 解壓到結尾時多讀的位元組屬於下一段，放回讀取器
+            # Bytes read past the end of the deflate stream belong to what follows
+            reader.unread(decompressor.unused_data)
+            break
+    return crc
+
+
+def read_zip_descriptor(reader):
+    first = struct.unpack("<I", reader.read_exact(4))[0]
+    if first == ZIP_DESCRIPTOR_SIGNATURE:
+        first = struct.unpack("<I", reader.read_exact(4))[0]
+    reader.skip(8)
+    return first
+
+
+def sidecar_path(ffmpeg_exe):
+    return ffmpeg_exe + ".sha256.json"
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def write_sidecar(ffmpeg_exe, digest):
+    st = os.stat(ffmpeg_exe)
+    with open(sidecar_path(ffmpeg_exe), "w", encoding="utf-8") as f:
+        json.dump({"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}, f)
+
+
+def is_installed(ffmpeg_exe):
+    """True if ``ffmpeg_exe`` exists and matches the checksum recorded when it was installed.
+
+    While the file's size and mtime match the record this costs a single stat;
+    the binary is only hashed again after it changed on disk. A binary from
+    before checksums were recorded is hashed once and trusted.
+    """
+    try:
+        st = os.stat(ffmpeg_exe)
+    except OSError:
+        return False
+    try:
+        with open(sidecar_path(ffmpeg_exe), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        write_sidecar(ffmpeg_exe, file_sha256(ffmpeg_exe))
+        return True
+    if record.get("size") == st.st_size and record.get("mtime_ns") == st.st_mtime_ns:
+        return True
+    if file_sha256(ffmpeg_exe) != record.get("sha256"):
+        return False
+    write_sidecar(ffmpeg_exe, record["sha256"])
+    return True
+
+
+def install(url, kind, name, ffmpeg_exe, session=None):
+    """Stream the archive at ``url`` and extract ``name`` from it as ``ffmpeg_exe``.
+
+    Nothing but the binary is written to disk: the archive is decompressed as
+    it arrives and the download stops once the binary has been read. A checksum
+    sidecar is written next to it for ``is_installed``.
+    """
+    part_path = ffmpeg_exe + ".part"
+    session = session or http_client.session()
+    with session.get(url, stream=True) as r:
         r.raise_for_status()
-        with open(dest, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+        r.raw.decode_content = True
+        try:
+            with open(part_path, "wb") as f:
+                writer = HashingWriter(f)
+                if kind == "zip":
+                    found = extract_from_zip_stream(r.raw, name, writer)
+                else:
+                    found = extract_from_tar_stream(r.raw, name, writer)
+            if not found:
+                raise BootstrapError(f"{name} not found in {url}")
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    os.chmod(part_path, 0o755)
+    os.replace(part_path, ffmpeg_exe)
+    write_sidecar(ffmpeg_exe, writer.sha256.hexdigest())
+    return ffmpeg_exe
+
+
+def ensure(download_dir, system=None):
+    """Install ffmpeg for this platform into ``download_dir`` unless it is already there.
+
+    Returns the path of the binary; raises on unsupported platforms and failed downloads.
+    """
+    system = system or platform.system()
+    if system not in SOURCES:
+        raise BootstrapError(f"Unsupported platform: {system}")
+    url, kind, name = SOURCES[system]
+    ffmpeg_exe = os.path.join(download_dir, "ffmpeg.exe" if system == "Windows" else "ffmpeg")
+    if is_installed(ffmpeg_exe):
+        return ffmpeg_exe
+    os.makedirs(download_dir, exist_ok=True)
+    return install(url, kind, name, ffmpeg_exe)
+
 
 def main(download_dir=None):
     if download_dir is None:
-        # 如果沒指定，預設還是 assets（但建議 always 傳入 user_data_dir）
-        download_dir = os.path.join(os.path.dirname(__file__), "assets")
-    if not os.path.exists(download_dir):
-        os.makedirs(download_dir)
+        # 沒指定時安裝到程式實際尋找 FFmpeg 的 user_data_dir
+        # Default to user_data_dir, where the app actually looks for FFmpeg
+        from common import user_data_dir
+        download_dir = user_data_dir
     system = platform.system()
+    if system not in SOURCES:
+        print("不支援的平台，請自行安裝 ffmpeg。")
+        sys.exit(1)
     ffmpeg_exe = os.path.join(download_dir, "ffmpeg.exe" if system == "Windows" else "ffmpeg")
-    if os.path.exists(ffmpeg_exe):
+    if is_installed(ffmpeg_exe):
         print("ffmpeg 已存在！")
         return
 
     print(f"正在為 {system} 下載 ffmpeg ...")
-    if system == "Windows":
-        url = "https://www.gyan.dev/ffmpeg/builds/ffmpeg-release-essentials.zip"
-        zip_path = os.path.join(download_dir, "ffmpeg_win.zip")
-        download_file(url, zip_path)
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(download_dir)
-        for root, dirs, files in os.walk(download_dir):
-            if "ffmpeg.exe" in files:
-                shutil.copy2(os.path.join(root, "ffmpeg.exe"), ffmpeg_exe)
-                break
-        os.remove(zip_path)
-    elif system == "Darwin":
-        url = "https://evermeet.cx/ffmpeg/ffmpeg-6.1.1.zip"
-        zip_path = os.path.join(download_dir, "ffmpeg_mac.zip")
-        download_file(url, zip_path)
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(download_dir)
-        shutil.move(os.path.join(download_dir, "ffmpeg"), ffmpeg_exe)
-        os.remove(zip_path)
-        os.chmod(ffmpeg_exe, 0o755)
-    elif system == "Linux":
-        url = "https://johnvansickle.com/ffmpeg/releases/ffmpeg-release-amd64-static.tar.xz"
-        tar_path = os.path.join(download_dir, "ffmpeg_linux.tar.xz")
-        download_file(url, tar_path)
-        with tarfile.open(tar_path, "r:xz") as tar:
-            for member in tar.getmembers():
-                if member.isfile() and member.name.endswith("/ffmpeg"):
-                    member.name = os.path.basename(member.name)
-                    tar.extract(member, download_dir)
-                    shutil.move(os.path.join(download_dir, "ffmpeg"), ffmpeg_exe)
-                    os.chmod(ffmpeg_exe, 0o755)
-                    break
-        os.remove(tar_path)
-    else:
-        print("不支援的平台，請自行安裝 ffmpeg。")
-        sys.exit(1)
+    ensure(download_dir, system)
     print("ffmpeg 已下載並放到 user_data_dir 目錄！")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
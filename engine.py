@@ -0,0 +1,460 @@
+import os
+import queue
+import struct
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+
+from pytubefix import Playlist
+from pytubefix.exceptions import RegexMatchError, VideoUnavailable
+
+import http_client
+import segmented_download
+from bandwidth import BandwidthScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from common import (
+    user_data_dir, METRICS_PATH, DEFAULT_PLAYLIST_WORKERS, MAX_PLAYLIST_WORKERS,
+    sanitize_filename, log_error,
+)
+from download_archive import DownloadArchive
+from media_store import MediaStore
+from metadata_cache import MetadataCache, video_id_from_url
+from mux_planner import choose_audio, plan_mux
+from postprocess import PostProcessor
+from progress_bus import ProgressBus
+
+# 播放清單一律下載最佳畫質，下載紀錄以此為解析度鍵值
+# Playlists always download the best quality; this is their archive resolution key
+PLAYLIST_RESOLUTION = 'best'
+# 等待下一個完成項目時，多久檢查一次新列舉到的影片（秒）
+# While waiting for items to finish, how often newly enumerated videos are picked up (s)
+PLAYLIST_POLL = 0.2
+
+
+def mp3_args(source, final_path):
+    return ['-i', source, '-vn', '-ab', '192k', '-ar', '44100', '-y', final_path]
+
+
+class NotStreamable(RuntimeError):
+    pass
+
+
+class NoStreamError(Exception):
+    pass
+
+
+# 重試也不會成功的錯誤：影片不存在、網址錯誤、沒有可用串流
+# Errors a retry cannot fix: missing videos, bad URLs, no usable stream
+PERMANENT_ERRORS = (ValueError, RegexMatchError, VideoUnavailable, NoStreamError)
+
+
+def moov_first(chunks, limit=1024 * 1024):
+    """Pass ``chunks`` through, failing early if the mp4 index comes after the media.
+
+    ffmpeg can only decode an mp4 from a pipe when its ``moov`` box comes before
+    ``mdat``. YouTube's DASH audio is laid out that way, but this guards against
+    streams that are not, before ffmpeg has written anything.
+    """
+    buffer = b''
+    offset = 0
+    chunks = iter(chunks)
+    for chunk in chunks:
+        buffer += chunk
+        while offset + 8 <= len(buffer):
+            size, box = struct.unpack('>I4s', buffer[offset:offset + 8])
+            if box == b'moov':
+                yield buffer
+                yield from chunks
+                return
+            if box == b'mdat' or size < 8:
+                raise NotStreamable("mp4 index is stored after the media data")
+            offset += size
+        if len(buffer) > limit:
+            break
+    yield buffer
+    yield from chunks
+
+
+def available_resolutions(info, fmt):
+    """Return the resolutions offered for ``fmt``, highest first."""
+    resolutions = set()
+    for s in info.streams.filter(progressive=True, file_extension=fmt):
+        if s.resolution:
+            resolutions.add(s.resolution)
+    for s in info.streams.filter(adaptive=True, only_video=True, file_extension=fmt):
+        if s.resolution:
+            resolutions.add(s.resolution)
+    return sorted(resolutions, key=lambda x: int(x.replace('p', '')), reverse=True)
+
+
+class DownloadEngine:
+    """Download core shared by the GUI and the command line.
+
+    Nothing here touches tkinter or PIL: callers pass plain settings in and get
+    results and exceptions back, while progress, messages and per-job metrics
+    flow through ``self.bus``. Every transfer draws from ``self.bandwidth``;
+    single videos run at interactive priority and playlist items in the
+    background. ``ffmpeg_ready`` is an optional Future for ffmpeg's install;
+    only the ffmpeg steps wait for it, and ``ffmpeg_bootstrap`` starts the
+    install again after it failed. Finished playlist videos are indexed in
+    ``self.store`` and linked into every other playlist folder that needs them.
+    """
+
+    def __init__(self, ffmpeg_path, bus=None, bandwidth=None, data_dir=user_data_dir,
+                 ffmpeg_ready=None, ffmpeg_bootstrap=None):
+        self.ffmpeg_path = ffmpeg_path
+        # pytubefix 的請求也改走共用的連線池
+        # pytubefix requests share the pooled transport as well
+        http_client.install_pytubefix()
+        self.bus = bus or ProgressBus(METRICS_PATH)
+        self.bandwidth = bandwidth or BandwidthScheduler()
+        self.postprocessor = PostProcessor(
+            ffmpeg_path, ready=ffmpeg_ready, bootstrap=ffmpeg_bootstrap
+        )
+        self.metadata = MetadataCache(os.path.join(data_dir, "metadata"))
+        self.archive = DownloadArchive(os.path.join(data_dir, "archive.sqlite3"))
+        self.store = MediaStore(os.path.join(data_dir, "store"))
+
+    def shutdown(self):
+        self.postprocessor.shutdown()
+        self.archive.close()
+        self.store.close()
+
+    def download_single_video(self, url, folder, fmt, resolution=None, on_stage=None):
+        """Download one video and return the path of the finished file.
+
+        An empty ``resolution`` or ``'best'`` picks the highest one available.
+        ``on_stage(job, stage)`` is called as each stage of the download begins.
+        """
+        job = self.bus.start_job(url, PRIORITY_INTERACTIVE)
+        job.on_stage = on_stage
+        try:
+            final_path = self.fetch_single_video(job, url, folder, fmt, resolution)
+        except Exception as e:
+            job.finish(e)
+            raise
+        job.finish()
+        return final_path
+
+    def fetch_single_video(self, job, url, folder, fmt, resolution):
+        with job.timed('metadata'):
+            info = self.metadata.get(url)
+        job.label = info.title
+        video_title = sanitize_filename(info.title)
+        final_path = os.path.join(folder, f"{video_title}.{fmt}")
+        if fmt != 'mp3' and (not resolution or resolution == 'best'):
+            res_list = available_resolutions(info, fmt)
+            resolution = res_list[0] if res_list else None
+
+        if fmt == 'mp3':
+            audio_stream = info.streams.filter(
+                only_audio=True, file_extension='mp4'
+            ).order_by('abr').desc().first()
+            if audio_stream is None:
+                raise NoStreamError("No audio stream found.")
+            self.postprocessor.check_ready()
+            future = self.download_mp3(job, audio_stream, folder, video_title, final_path)
+            if future:
+                future.result()
+        else:
+            stream = info.streams.filter(
+                progressive=True, file_extension=fmt, resolution=resolution
+            ).first()
+            if stream:
+                with job.timed('download'):
+                    self.fetch_stream(job, stream, folder, f"{video_title}.{fmt}")
+            else:
+                video_stream = info.streams.filter(
+                    adaptive=True, only_video=True, file_extension=fmt, resolution=resolution
+                ).first()
+                audio_stream = choose_audio(info.streams, fmt)
+                if video_stream and audio_stream:
+                    # FFmpeg 無法使用時不先下載，以免白白下載後丟棄
+                    # Don't download streams that could not be muxed anyway
+                    self.postprocessor.check_ready()
+                    video_path, audio_path = self.download_adaptive(
+                        job, video_stream, audio_stream, folder, video_title
+                    )
+                    self.postprocessor.submit(
+                        plan_mux(video_stream, audio_stream, video_path, audio_path,
+                                 final_path, fmt),
+                        temp_files=[video_path, audio_path], output=final_path, job=job
+                    ).result()
+                else:
+                    raise NoStreamError("No suitable stream found.")
+        return final_path
+
+    def fetch_stream(self, job, stream, folder, filename):
+        """Download ``stream`` into ``folder/filename`` and return the file path.
+
+        Uses segmented Range requests, and an interrupted transfer resumes from
+        its ``.part.json`` manifest the next time the same file is requested. A
+        file already complete from an earlier attempt is reused as it is.
+        """
+        path = os.path.join(folder, filename)
+        if stream.filesize and os.path.exists(path) and os.path.getsize(path) == stream.filesize:
+            job.update_bytes(stream.itag, stream.filesize, stream.filesize)
+            return path
+        return segmented_download.download(
+            stream.url, path,
+            on_progress=job.bytes_callback(stream.itag),
+            throttle=self.bandwidth.limiter(job.priority)
+        )
+
+    def download_mp3(self, job, audio_stream, folder, video_title, final_path):
+        """Transcode ``audio_stream`` to mp3 while it downloads.
+
+        The audio is piped straight into ffmpeg, so it is never written to disk
+        before encoding. If ffmpeg cannot read the stream from a pipe, the audio
+        is downloaded to a temp file instead and the returned Future tracks that
+        transcode. Returns None when the streamed transcode succeeded.
+        """
+        try:
+            self.postprocessor.pipe(
+                mp3_args('pipe:0', final_path),
+                moov_first(segmented_download.iter_content(
+                    audio_stream.url, on_progress=job.bytes_callback(audio_stream.itag),
+                    throttle=self.bandwidth.limiter(job.priority)
+                )),
+                output=final_path, job=job
+            )
+            return None
+        except RuntimeError as e:
+            log_error(f"Streaming to mp3 failed, retrying from a temp file: {str(e)}")
+        job.add_temp(os.path.join(folder, f"{video_title}_audio.mp4"))
+        with job.timed('download'):
+            temp_audio = self.fetch_stream(job, audio_stream, folder, f"{video_title}_audio.mp4")
+        return self.postprocessor.submit(
+            mp3_args(temp_audio, final_path), temp_files=[temp_audio], output=final_path,
+            job=job, stage='transcode'
+        )
+
+    def download_adaptive(self, job, video_stream, audio_stream, folder, video_title):
+        """Fetch the video and audio tracks at the same time.
+
+        Returns ``(video_path, audio_path)`` once both transfers have finished.
+        Both paths are registered as temp files on ``job`` before either starts.
+        """
+        video_name = f"video_{video_title}.{video_stream.subtype}"
+        audio_name = f"audio_{video_title}.{audio_stream.subtype}"
+        job.add_temp(os.path.join(folder, video_name))
+        job.add_temp(os.path.join(folder, audio_name))
+        with job.timed('download'), ThreadPoolExecutor(max_workers=2) as pool:
+            video_future = pool.submit(self.fetch_stream, job, video_stream, folder, video_name)
+            audio_future = pool.submit(self.fetch_stream, job, audio_stream, folder, audio_name)
+            # 其中一個失敗時，另一個已完成的暫存檔留給重試使用；
+            # 工作最終失敗時由佇列清除
+            # If one transfer fails, the other's finished temp file is kept for
+            # the retry; the job queue removes it if the job fails for good
+            return video_future.result(), audio_future.result()
+
+    def download_playlist(self, url, folder, fmt, workers=DEFAULT_PLAYLIST_WORKERS, on_stage=None):
+        """Download every video of a playlist into ``folder``.
+
+        The playlist is enumerated lazily, one page at a time, and downloads start
+        as soon as the first page arrives. ``playlist_progress`` events report the
+        number of videos seen so far as ``total``, which grows as more pages load.
+        Items that fail are logged and skipped. ``on_stage(job, stage)`` is
+        called from every item's thread as its stages begin. Returns
+        ``(done, failed, permanent)``, where ``permanent`` counts the failures
+        a retry cannot fix (``PERMANENT_ERRORS``).
+        """
+        self.bus.publish('playlist_started', url=url)
+        try:
+            return self.run_playlist(url, folder, fmt, workers, on_stage)
+        finally:
+            self.bus.publish('playlist_finished', url=url)
+
+    def enumerate_playlist(self, url, videos, progress):
+        """Put ``(index, video_url)`` on ``videos`` as each playlist page loads.
+
+        Runs on its own thread, so ``total`` grows with every page regardless of
+        how far the downloads have got. Ends with ``None``, or with the
+        exception that stopped the enumeration.
+        """
+        try:
+            for item in enumerate(Playlist(url).url_generator()):
+                videos.put(item)
+                progress(total=1)
+        except Exception as e:
+            videos.put(e)
+        else:
+            videos.put(None)
+
+    def run_playlist(self, url, folder, fmt, workers, on_stage=None):
+        workers = max(1, min(workers, MAX_PLAYLIST_WORKERS))
+        # 下載只比工作執行緒多排一些，列舉則在背景持續進行
+        # Downloads are only queued a little ahead of the workers, while the
+        # enumeration keeps going in the background
+        max_in_flight = workers * 2
+        counts = {'done': 0, 'total': 0}
+        lock = threading.Lock()
+
+        def progress(done=0, total=0):
+            with lock:
+                counts['done'] += done
+                counts['total'] += total
+                self.bus.publish('playlist_progress', url=url, **counts)
+
+        videos = queue.Queue()
+        threading.Thread(
+            target=self.enumerate_playlist, args=(url, videos, progress),
+            name='playlist-enumerate', daemon=True
+        ).start()
+        finished = failed = permanent = 0
+        exhausted = False
+        pending = set()
+        progress()
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while pending or not exhausted:
+                while not exhausted and len(pending) < max_in_flight:
+                    try:
+                        # 沒有進行中的項目時才阻塞等待下一部影片
+                        # Only block for the next video when nothing else is in flight
+                        item = videos.get(block=not pending)
+                    except queue.Empty:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    if item is None:
+                        exhausted = True
+                        break
+                    index, video_url = item
+                    pending.add(
+                        pool.submit(
+                            self.download_playlist_item, index, video_url, folder, fmt, on_stage
+                        )
+                    )
+                if not pending:
+                    continue
+                timeout = None if exhausted or len(pending) >= max_in_flight else PLAYLIST_POLL
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        log_error(f"Post-processing failed: {str(e)}")
+                        result = e
+                    # 下載完成後交給 ffmpeg，等合併結束才算完成
+                    # A finished download hands back its ffmpeg job; the item
+                    # only counts as done once that job finishes too
+                    if isinstance(result, Future):
+                        pending.add(result)
+                        continue
+                    finished += 1
+                    if isinstance(result, Exception):
+                        failed += 1
+                        permanent += isinstance(result, PERMANENT_ERRORS)
+                    progress(done=1)
+        return finished - failed, failed, permanent
+
+    def download_playlist_item(self, index, video_url, folder, fmt, on_stage=None):
+        """Download one playlist entry.
+
+        Returns the post-processing Future when ffmpeg still has to run, so the
+        worker can move on to the next download straight away. Otherwise returns
+        True on success and the exception on failure.
+        """
+        job = self.bus.start_job(video_url, PRIORITY_BACKGROUND)
+        job.on_stage = on_stage
+        try:
+            result = self.fetch_playlist_item(job, index, video_url, folder, fmt)
+        except Exception as e:
+            log_error(
+                f"Failed to download video {video_url}: {str(e)}\n{traceback.format_exc()}"
+            )
+            job.finish(e)
+            return e
+        if isinstance(result, Future):
+            result.add_done_callback(lambda f: job.finish(f.exception()))
+        else:
+            job.finish()
+        return result
+
+    def fetch_playlist_item(self, job, index, video_url, folder, fmt):
+        # 下載紀錄中已有的影片直接略過，不需任何網路請求
+        # Entries already in the download archive are skipped before any
+        # network call
+        video_id = video_id_from_url(video_url)
+        if self.archive.contains(video_id, fmt, PLAYLIST_RESOLUTION, folder):
+            return True
+        # 其他播放清單已下載過的影片，直接從存放區連結過來
+        # Videos already fetched for another playlist are linked in from the store
+        stored = self.store.lookup(video_id, fmt, PLAYLIST_RESOLUTION)
+        if stored is not None and self.place_stored(job, video_id, fmt, index, folder, *stored):
+            return True
+        with job.timed('metadata'):
+            info = self.metadata.get(video_url)
+        job.label = info.title
+        video_title = sanitize_filename(f"{index+1:02d}_{info.title}")
+        final_path = os.path.join(
+            folder, f"{video_title}.{fmt if fmt != 'mp3' else 'mp3'}"
+        )
+        if os.path.exists(final_path):
+            result = True
+        elif fmt == 'mp3':
+            audio_stream = info.streams.filter(
+                only_audio=True, file_extension='mp4'
+            ).order_by('abr').desc().first()
+            if audio_stream is None:
+                raise NoStreamError(f"{video_title}: no audio stream found")
+            self.postprocessor.check_ready()
+            result = self.download_mp3(job, audio_stream, folder, video_title, final_path) or True
+        else:
+            video_stream = info.streams.filter(
+                adaptive=True, only_video=True, file_extension=fmt
+            ).order_by('resolution').desc().first()
+            audio_stream = choose_audio(info.streams, fmt)
+            if video_stream and audio_stream:
+                self.postprocessor.check_ready()
+                # 以編號命名暫存檔，避免同時下載的影片互相覆蓋
+                # Name temp files by index so concurrent items never collide
+                video_path, audio_path = self.download_adaptive(
+                    job, video_stream, audio_stream, folder, video_title
+                )
+                result = self.postprocessor.submit(
+                    plan_mux(video_stream, audio_stream, video_path, audio_path,
+                             final_path, fmt),
+                    temp_files=[video_path, audio_path], output=final_path, job=job
+                )
+            else:
+                stream = info.streams.filter(
+                    progressive=True, file_extension=fmt
+                ).order_by('resolution').desc().first()
+                if not stream:
+                    raise NoStreamError(f"{video_title}: no suitable stream found")
+                with job.timed('download'):
+                    self.fetch_stream(job, stream, folder, f"{video_title}.{fmt}")
+                result = True
+        self.record_download(video_id, fmt, PLAYLIST_RESOLUTION, final_path, result, info.title)
+        return result
+
+    def place_stored(self, job, video_id, fmt, index, folder, title, src):
+        """Link the stored copy ``src`` into ``folder``; False if it has to be downloaded after all."""
+        job.label = title
+        final_path = os.path.join(folder, sanitize_filename(f"{index+1:02d}_{title}") + f".{fmt}")
+        try:
+            if os.path.abspath(final_path) != src and not os.path.exists(final_path):
+                self.store.place(video_id, fmt, PLAYLIST_RESOLUTION, title, src, final_path)
+        except OSError as e:
+            log_error(f"Could not place {final_path} from the media store: {str(e)}")
+            return False
+        self.archive.add(video_id, fmt, PLAYLIST_RESOLUTION, final_path)
+        return True
+
+    def record_download(self, video_id, fmt, resolution, final_path, result, title):
+        """Add a finished download to the archive and the store.
+
+        Futures are recorded once they succeed.
+        """
+        def record():
+            self.archive.add(video_id, fmt, resolution, final_path)
+            try:
+                self.store.add(video_id, fmt, resolution, final_path, title)
+            except OSError as e:
+                log_error(f"Could not add {final_path} to the media store: {str(e)}")
+
+        if isinstance(result, Future):
+            result.add_done_callback(lambda f: f.exception() is None and record())
+        elif result:
+            record()
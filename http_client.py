@@ -0,0 +1,162 @@
+import io
+import json
+import socket
+import threading
+from urllib.error import HTTPError, URLError
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 每個主機保留的連線數，以及快取多少個主機的連線池
+# Connections kept alive per host, and how many hosts keep a pool
+DEFAULT_POOL_SIZE = 32
+DEFAULT_POOL_HOSTS = 32
+# (連線, 讀取) 逾時秒數
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 30)
+# 連線錯誤與暫時性狀態碼的重試，退避時間加入隨機抖動
+# Retries for connection errors and transient statuses, with jittered backoff
+DEFAULT_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+BACKOFF_JITTER = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+_lock = threading.Lock()
+_session = None
+_settings = {
+    'pool_size': DEFAULT_POOL_SIZE, 'timeout': DEFAULT_TIMEOUT, 'retries': DEFAULT_RETRIES,
+}
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """``HTTPAdapter`` that applies a default timeout to requests that set none."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def build_session(pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES):
+    retry = Retry(
+        total=retries, connect=retries, read=retries, status=retries,
+        backoff_factor=BACKOFF_FACTOR, backoff_jitter=BACKOFF_JITTER,
+        status_forcelist=RETRY_STATUSES, raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=timeout, max_retries=retry,
+        pool_connections=DEFAULT_POOL_HOSTS, pool_maxsize=pool_size,
+    )
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def session():
+    """Return the process-wide ``requests.Session``.
+
+    Connections stay alive per host, so thumbnails, metadata requests, stream
+    downloads and the ffmpeg bootstrap reuse TLS sessions instead of repeating
+    handshakes.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = build_session(**_settings)
+        return _session
+
+
+def configure(pool_size=None, timeout=None, retries=None):
+    """Change the shared transport settings; later ``session()`` calls use them."""
+    global _session
+    with _lock:
+        if pool_size is not None:
+            _settings['pool_size'] = pool_size
+        if timeout is not None:
+            _settings['timeout'] = timeout
+        if retries is not None:
+            _settings['retries'] = retries
+        old, _session = _session, None
+    if old is not None:
+        old.close()
+
+
+class UrllibResponse:
+    """Just enough of urllib's response object for pytubefix, backed by ``requests``."""
+
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self.url = response.url
+
+    def read(self, amt=None):
+        if amt is None:
+            # 讀完整個內容會讓連線回到連線池
+            # Reading the whole body hands the connection back to the pool
+            data = self.response.content
+            self.response._content = b''
+            return data
+        data = self.response.raw.read(amt, decode_content=True)
+        if not data:
+            self.response.close()
+        return data
+
+    def info(self):
+        return self.headers
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def execute_request(url, method=None, headers=None, data=None,
+                    timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """Drop-in replacement for ``pytubefix.request._execute_request`` on the shared session.
+
+    Keeps urllib's behaviour: POST when ``data`` is given, dicts sent as JSON,
+    ``HTTPError`` for error statuses and ``URLError`` for connection failures.
+    """
+    if not url.lower().startswith("http"):
+        raise ValueError("Invalid URL")
+    if data and not isinstance(data, bytes):
+        data = json.dumps(data).encode("utf-8")
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = None
+    try:
+        response = session().request(
+            method or ("POST" if data is not None else "GET"), url,
+            headers=headers, data=data or None, timeout=timeout, stream=True
+        )
+    except requests.Timeout as e:
+        raise URLError(socket.timeout(str(e)))
+    except requests.ConnectionError as e:
+        raise URLError(e)
+    if response.status_code >= 400:
+        body = response.content
+        response.close()
+        raise HTTPError(url, response.status_code, response.reason, response.headers, io.BytesIO(body))
+    return UrllibResponse(response)
+
+
+def install_pytubefix():
+    """Route pytubefix's metadata and innertube requests through the shared session."""
+    from pytubefix import request
+    request._execute_request = execute_request
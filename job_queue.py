@@ -0,0 +1,332 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import traceback
+
+from bandwidth import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from common import DEFAULT_PLAYLIST_WORKERS, log_error
+from engine import PERMANENT_ERRORS
+from metadata_cache import video_id_from_url
+
+QUEUED, FETCHING, MUXING, DONE, FAILED = 'queued', 'fetching', 'muxing', 'done', 'failed'
+ACTIVE_STATES = (QUEUED, FETCHING, MUXING)
+KINDS = ('video', 'playlist')
+
+# 失敗後以指數退避重試：30 秒、1 分、2 分……最長 30 分鐘
+# Failed jobs retry with exponential backoff: 30 s, 1 min, 2 min ... up to 30 min
+MAX_ATTEMPTS = 5
+RETRY_BASE = 30.0
+RETRY_MAX = 30 * 60.0
+# 已完成的工作保留一週
+# Finished jobs are kept for a week
+DONE_RETENTION = 7 * 24 * 3600
+# 重試前的最長等待，讓新加入的工作也能被及時看到
+# Longest idle wait, so newly due retries are noticed even without a notify
+IDLE_POLL = 5.0
+
+
+def retry_delay(attempts):
+    """Backoff before attempt ``attempts + 1``, with ±20% jitter so retries spread out."""
+    delay = min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def remove_temp_files(paths):
+    """Remove temp downloads together with any resumable ``.part`` leftovers."""
+    for path in paths:
+        for leftover in (path, path + ".part", path + ".part.json"):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+
+
+class JobQueue:
+    """Download requests stored in SQLite, so they survive restarts and crashes.
+
+    Each row is one video or playlist request and moves through
+    ``queued -> fetching -> muxing -> done``, or back to ``queued`` with a
+    later ``next_attempt_at`` when it fails and may be retried. Every change is
+    committed straight away, so whatever was running when the app stopped is
+    found in ``fetching``/``muxing`` on the next start and queued again.
+    """
+
+    def __init__(self, db_path):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, url TEXT NOT NULL,"
+                " folder TEXT NOT NULL, fmt TEXT NOT NULL, resolution TEXT, workers INTEGER,"
+                " priority INTEGER NOT NULL, state TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL,"
+                " error TEXT, temp_files TEXT NOT NULL DEFAULT '[]',"
+                " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_due ON jobs (state, next_attempt_at)"
+            )
+
+    def enqueue(self, kind, url, folder, fmt, resolution=None, workers=None):
+        """Add a request and return its id; an identical unfinished request is reused."""
+        priority = PRIORITY_INTERACTIVE if kind == 'video' else PRIORITY_BACKGROUND
+        folder = os.path.abspath(folder)
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND url = ? AND folder = ? AND fmt = ?"
+                " AND IFNULL(resolution, '') = IFNULL(?, '') AND state IN (?, ?, ?)",
+                (kind, url, folder, fmt, resolution, *ACTIVE_STATES)
+            ).fetchone()
+            if row is not None:
+                return row['id']
+            return self.conn.execute(
+                "INSERT INTO jobs (kind, url, folder, fmt, resolution, workers, priority, state,"
+                " next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, url, folder, fmt, resolution, workers, priority, QUEUED, now, now, now)
+            ).lastrowid
+
+    def recover(self):
+        """Requeue jobs interrupted by a crash or exit, and tidy up finished ones.
+
+        Returns the number of requeued jobs. Their temp files stay in place so
+        the next attempt can reuse or resume them; permanently failed jobs have
+        theirs removed.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            resumed = self.conn.execute(
+                "UPDATE jobs SET state = ?, next_attempt_at = ?, updated_at = ?"
+                " WHERE state IN (?, ?)", (QUEUED, now, now, FETCHING, MUXING)
+            ).rowcount
+            failed = self.conn.execute(
+                "SELECT id, temp_files FROM jobs WHERE state = ? AND temp_files != '[]'", (FAILED,)
+            ).fetchall()
+            for row in failed:
+                remove_temp_files(json.loads(row['temp_files']))
+                self.conn.execute("UPDATE jobs SET temp_files = '[]' WHERE id = ?", (row['id'],))
+            self.conn.execute(
+                "DELETE FROM jobs WHERE state = ? AND updated_at < ?", (DONE, now - DONE_RETENTION)
+            )
+        return resumed
+
+    def claim(self, kinds):
+        """Mark the most urgent due job of one of ``kinds`` as fetching and return it."""
+        if not kinds:
+            return None
+        now = time.time()
+        marks = ', '.join('?' * len(kinds))
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                f"SELECT * FROM jobs WHERE state = ? AND next_attempt_at <= ? AND kind IN ({marks})"
+                " ORDER BY priority DESC, id LIMIT 1", (QUEUED, now, *kinds)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (FETCHING, now, row['id'])
+            )
+        job = dict(row)
+        job['attempts'] += 1
+        job['temp_files'] = json.loads(job['temp_files'])
+        return job
+
+    def next_due(self, kinds):
+        """Return when the next queued job of ``kinds`` becomes due, or None."""
+        if not kinds:
+            return None
+        marks = ', '.join('?' * len(kinds))
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT MIN(next_attempt_at) FROM jobs WHERE state = ? AND kind IN ({marks})",
+                (QUEUED, *kinds)
+            ).fetchone()
+        return row[0]
+
+    def update(self, job_id, state, temp_files=None):
+        with self.lock, self.conn:
+            if temp_files is None:
+                self.conn.execute(
+                    "UPDATE jobs SET state = ?, updated_at = ? WHERE id = ?",
+                    (state, time.time(), job_id)
+                )
+            else:
+                self.conn.execute(
+                    "UPDATE jobs SET state = ?, temp_files = ?, updated_at = ? WHERE id = ?",
+                    (state, json.dumps(sorted(temp_files)), time.time(), job_id)
+                )
+
+    def finish(self, job_id):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, error = NULL, temp_files = '[]', updated_at = ?"
+                " WHERE id = ?", (DONE, time.time(), job_id)
+            )
+
+    def fail(self, job_id, error, retry=True):
+        """Record a failed attempt.
+
+        Returns the delay before the retry, or None once the job has failed for
+        good; in that case its temp files are removed.
+        """
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT attempts, temp_files FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if retry and row['attempts'] < MAX_ATTEMPTS:
+                delay = retry_delay(row['attempts'])
+                self.conn.execute(
+                    "UPDATE jobs SET state = ?, error = ?, next_attempt_at = ?, updated_at = ?"
+                    " WHERE id = ?", (QUEUED, error, now + delay, now, job_id)
+                )
+                return delay
+            self.conn.execute(
+                "UPDATE jobs SET state = ?, error = ?, temp_files = '[]', updated_at = ?"
+                " WHERE id = ?", (FAILED, error, now, job_id)
+            )
+        remove_temp_files(json.loads(row['temp_files']))
+        return None
+
+
+class QueueRunner:
+    """Feeds jobs from a ``JobQueue`` to a ``DownloadEngine`` on background threads.
+
+    Up to ``max_videos`` single videos and ``max_playlists`` playlists run at
+    once; single videos are claimed first. Outcomes go out on the engine's bus
+    as ``message`` events: ``download_complete``/``playlist_complete`` keys on
+    success, a ``playlist_skipped`` warning when some playlist videos can never
+    be downloaded, the error text once a job has used up its retries.
+    """
+
+    def __init__(self, engine, queue, max_videos=4, max_playlists=1):
+        self.engine = engine
+        self.queue = queue
+        self.limits = {'video': max_videos, 'playlist': max_playlists}
+        self.running = {kind: 0 for kind in KINDS}
+        self.cond = threading.Condition()
+
+    def start(self):
+        resumed = self.queue.recover()
+        if resumed:
+            log_error(f"Resuming {resumed} unfinished download job(s)")
+        threading.Thread(target=self.dispatch, name='job-queue', daemon=True).start()
+        # 從影片存放索引中移除已刪除的播放清單檔案
+        # Drop playlist files that were deleted from the media store's index
+        threading.Thread(target=self.collect_store, name='media-store-gc', daemon=True).start()
+
+    def collect_store(self):
+        try:
+            removed = self.engine.store.collect()
+        except Exception as e:
+            log_error(f"Media store cleanup failed: {str(e)}\n{traceback.format_exc()}")
+            return
+        if removed:
+            log_error(f"Dropped {removed} deleted or changed file(s) from the media store")
+
+    def notify(self):
+        """Wake the dispatcher after a job was enqueued."""
+        with self.cond:
+            self.cond.notify()
+
+    def dispatch(self):
+        while True:
+            with self.cond:
+                kinds = [kind for kind in KINDS if self.running[kind] < self.limits[kind]]
+                job = self.queue.claim(kinds)
+                if job is None:
+                    due = self.queue.next_due(kinds)
+                    timeout = IDLE_POLL if due is None else min(max(due - time.time(), 0.05), IDLE_POLL)
+                    self.cond.wait(timeout)
+                    continue
+                self.running[job['kind']] += 1
+            # 工作執行緒設為 daemon：關閉程式時未完成的工作留在佇列，下次啟動再續傳
+            # Daemon threads: closing the app leaves unfinished jobs queued for next start
+            threading.Thread(target=self.run, args=(job,), daemon=True).start()
+
+    def run(self, job):
+        try:
+            skipped = self.execute(job)
+        except Exception as e:
+            log_error(
+                f"Job {job['id']} ({job['url']}) attempt {job['attempts']} failed: "
+                f"{str(e)}\n{traceback.format_exc()}"
+            )
+            # 重試時重新取得影片資訊，以免沿用已失效的串流網址
+            # Retries fetch fresh metadata rather than reuse stream URLs that may have gone stale
+            if job['kind'] == 'video':
+                try:
+                    self.engine.metadata.invalidate(video_id_from_url(job['url']))
+                except ValueError:
+                    pass
+            delay = self.queue.fail(job['id'], str(e), retry=not isinstance(e, PERMANENT_ERRORS))
+            if delay is None:
+                self.engine.bus.message('error', f"{job['url']}: {e}")
+            else:
+                log_error(f"Job {job['id']} will be retried in {delay:.0f} s")
+        else:
+            self.queue.finish(job['id'])
+            if skipped:
+                self.engine.bus.publish(
+                    'message', level='warning', key='playlist_skipped', args={'count': skipped}
+                )
+            else:
+                key = 'download_complete' if job['kind'] == 'video' else 'playlist_complete'
+                self.engine.bus.publish('message', level='info', key=key)
+        finally:
+            with self.cond:
+                self.running[job['kind']] -= 1
+                self.cond.notify()
+
+    def stage_tracker(self, job):
+        """Return an ``on_stage`` callback that records ``job``'s state and temp files.
+
+        A playlist row collects the temp files of all its items, so they are
+        removed if the playlist fails for good. It stays ``fetching`` while its
+        items move between stages; which items are done is kept in the
+        download archive.
+        """
+        current = {'state': FETCHING, 'temp_files': set(job['temp_files'])}
+        lock = threading.Lock()
+
+        # 只在狀態或暫存檔改變時寫入資料庫
+        # Only write to the database when the state or temp files change
+        def on_stage(progress_job, stage):
+            state = FETCHING
+            if job['kind'] == 'video' and stage not in ('metadata', 'download'):
+                state = MUXING
+            with lock:
+                temp_files = current['temp_files'] | progress_job.temp_files
+                if (state, temp_files) != (current['state'], current['temp_files']):
+                    current.update(state=state, temp_files=temp_files)
+                    self.queue.update(job['id'], state, temp_files)
+
+        return on_stage
+
+    def execute(self, job):
+        """Run ``job`` once; returns how many playlist videos were skipped for good."""
+        on_stage = self.stage_tracker(job)
+        if job['kind'] == 'video':
+            self.engine.download_single_video(
+                job['url'], job['folder'], job['fmt'], job['resolution'], on_stage=on_stage
+            )
+            return 0
+        _, failed, permanent = self.engine.download_playlist(
+            job['url'], job['folder'], job['fmt'],
+            workers=job['workers'] or DEFAULT_PLAYLIST_WORKERS, on_stage=on_stage
+        )
+        # 清單中已完成的影片記在下載紀錄裡，重試時只會重下失敗的部分；
+        # 只剩下架或沒有串流的影片時不再重試
+        # Finished videos are in the download archive, so a retry only
+        # fetches the ones that failed; videos that are gone or have no
+        # usable stream are not worth a retry
+        if failed > permanent:
+            raise RuntimeError(f"{failed - permanent} playlist video(s) failed")
+        return permanent
@@ -1,87 +1,84 @@
+# 啟動分析必須最先載入，之後的匯入才會被計時
+# The startup profiler goes first so every later import is timed
+import startup_profile
+startup_profile.enable_if_requested()
+
 import os
-import re
 import sys
-import time
 import json
-import threading
+import queue
 import traceback
-import subprocess
-from io import BytesIO
-import appdirs
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from pytubefix import YouTube, Playlist
-from PIL import Image, ImageTk
-import requests
-
-APP_NAME = "YouTubeDownloader"
-APP_AUTHOR = "NYCU_SDC_B"
-
-base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
-
-# 使用 appdirs 取得系統專屬持久化資料夾
-# Use appdirs to get the system-specific persistent data folder
-user_data_dir = appdirs.user_data_dir(APP_NAME, APP_AUTHOR)
-if not os.path.exists(user_data_dir):
-    os.makedirs(user_data_dir)
-
-def ensure_ffmpeg():
-    exe_name = "ffmpeg.exe" if os.name == "nt" else "ffmpeg"
-    ffmpeg_path = os.path.join(user_data_dir, exe_name)
-    if not os.path.exists(ffmpeg_path):
-        print("FFmpeg not found, process is trying download_ffmpeg.py to get it.")
-        try:
-            import download_ffmpeg
-            download_ffmpeg.main(download_dir=user_data_dir)
-        except Exception as e:
-            print(f"Error occurred while downloading FFmpeg: {e}")
-            return None
-    if not os.path.exists(ffmpeg_path):
-        return None
-    return ffmpeg_path
 
+# 下載核心（pytubefix、requests、PIL）在視窗出現後才於 start_backend 載入
+# The download backend (pytubefix, requests, PIL) is only imported in
+# start_backend, after the window is on screen
+from common import (
+    APP_NAME, base_path, user_data_dir, FFMPEG_PATH, STARTUP_PROFILE_PATH, FORMATS,
+    DEFAULT_PLAYLIST_WORKERS, MAX_PLAYLIST_WORKERS, bootstrap_ffmpeg, is_playlist_url, log_error,
+)
+from progress_bus import format_bytes, format_eta
 
-def load_lang_texts(lang_folder=None):
-    if lang_folder is None:
-        lang_folder = os.path.join(base_path, 'langs')
-    lang_texts = {}
-    if not os.path.exists(lang_folder):
-        print(f"Language folder not found: {lang_folder}")
-        return lang_texts
-    for fname in os.listdir(lang_folder):
-        if fname.endswith('.json'):
-            lang_code = fname.split('.')[0]
-            with open(os.path.join(lang_folder, fname), 'r', encoding='utf-8') as f:
-                lang_texts[lang_code] = json.load(f)
-    return lang_texts
-
+LANG_FOLDER = os.path.join(base_path, 'langs')
+DEFAULT_LANG = 'en'
+LANG_TEXTS = {}
 
-LOGS_DIR = os.path.join(base_path, "logs")
-if not os.path.exists(LOGS_DIR):
-    os.makedirs(LOGS_DIR, exist_ok=True)
 
-ERROR_LOG_PATH = os.path.join(LOGS_DIR, "YouTubeDownloader_errors.log")
+def available_langs(lang_folder=LANG_FOLDER):
+    """Language codes found in ``lang_folder``; no file is read yet."""
+    if not os.path.exists(lang_folder):
+        print(f"Language folder not found: {lang_folder}")
+        return []
+    return sorted(fname[:-5] for fname in os.listdir(lang_folder) if fname.endswith('.json'))
 
-DEFAULT_LANG = 'en'
-LANG_TEXTS = load_lang_texts()
 
+def load_lang(lang_code, lang_folder=LANG_FOLDER):
+    """Return one language's texts, reading its file the first time it is needed."""
+    if lang_code not in LANG_TEXTS:
+        path = os.path.join(lang_folder, f"{lang_code}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                LANG_TEXTS[lang_code] = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Language file could not be loaded: {path} ({e})")
+            LANG_TEXTS[lang_code] = {}
+    return LANG_TEXTS[lang_code]
 
-def sanitize_filename(name):
-    return re.sub(r'[\\/*?"<>|]', "", name)
+# 背景縮圖與解析度結果的輪詢間隔（毫秒）
+# How often the Tk loop picks up finished thumbnails and resolution lists (ms)
+THUMBNAIL_POLL_MS = 50
+# 下載進度的畫面更新間隔（毫秒），與下載速度無關
+# How often download progress is redrawn (ms), however fast bytes arrive
+PROGRESS_POLL_MS = 200
 
 
-def log_error(message):
-    with open(ERROR_LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}\n")
+def import_backend():
+    """Import the download backend, without creating or starting anything."""
+    from engine import DownloadEngine
+    from job_queue import JobQueue, QueueRunner
+    from thumbnail_cache import ThumbnailCache
+    return DownloadEngine, JobQueue, QueueRunner, ThumbnailCache
 
 
 class YouTubeDownloaderApp:
-    def __init__(self, root, ffmpeg_path):
+    def __init__(self, root):
         self.root = root
-        self.ffmpeg_path = ffmpeg_path
+        # 由 start_backend 建立
+        # Created by start_backend
+        self.engine = None
+        self.ffmpeg_ready = None
+        self.jobs = None
+        self.runner = None
+        self.thumbnails = None
+        self.thumbnail_results = queue.Queue()
+        self.thumbnail_key = None
+        self.metadata_pool = None
+        self.resolution_results = queue.Queue()
+        self.resolution_key = None
         self.root.title(APP_NAME)
-        self.root.geometry("560x580")
+        self.root.geometry("560x640")
         try:
             icon_path = os.path.join(base_path, "assets", "YouTubeDownloader.ico")
             if not os.path.exists(icon_path):
@@ -96,11 +93,47 @@ class YouTubeDownloaderApp:
         self.url = tk.StringVar()
         self.format_var = tk.StringVar(value='mp4')
         self.res_var = tk.StringVar()
+        self.workers_var = tk.IntVar(value=DEFAULT_PLAYLIST_WORKERS)
         self.thumbnail_photo = None
+        self.playlist_progress = None
 
         self.create_widgets()
         self.update_language()
 
+    def start_backend(self):
+        """Load the download engine, job queue and thumbnail cache.
+
+        Called once the window is on screen, so these imports and the ffmpeg
+        check do not delay the first frame. Safe to call again.
+        """
+        if self.engine is not None:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        DownloadEngine, JobQueue, QueueRunner, ThumbnailCache = import_backend()
+
+        self.ffmpeg_ready = bootstrap_ffmpeg()
+        self.engine = DownloadEngine(
+            FFMPEG_PATH, ffmpeg_ready=self.ffmpeg_ready, ffmpeg_bootstrap=bootstrap_ffmpeg
+        )
+        # FFmpeg 在背景安裝；失敗時在 Tk 執行緒顯示錯誤
+        # FFmpeg installs in the background; a failure is shown on the Tk thread
+        self.ffmpeg_ready.add_done_callback(
+            lambda f: f.exception() and self.engine.bus.publish(
+                'message', level='error', key='ffmpeg_failed', args={'path': FFMPEG_PATH}
+            )
+        )
+        # 下載工作存在 SQLite 佇列中，程式關閉或當機後下次啟動會續傳
+        # Download jobs live in a SQLite queue and resume on the next start
+        # after the app is closed or crashes
+        self.jobs = JobQueue(os.path.join(user_data_dir, "jobs.sqlite3"))
+        self.runner = QueueRunner(self.engine, self.jobs)
+        self.thumbnails = ThumbnailCache(os.path.join(user_data_dir, "thumbnails"))
+        self.metadata_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='metadata')
+        self.root.after(THUMBNAIL_POLL_MS, self.poll_thumbnails)
+        self.root.after(THUMBNAIL_POLL_MS, self.poll_resolutions)
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+        self.runner.start()
+
     def create_widgets(self):
         frm = ttk.Frame(self.root, padding=10)
         frm.pack(fill=tk.BOTH, expand=True)
@@ -126,7 +159,7 @@ class YouTubeDownloaderApp:
 
         ttk.Label(frm, text=self.lang_text('format')).grid(row=5, column=0, sticky='w')
         self.format_combo = ttk.Combobox(
-            frm, textvariable=self.format_var, values=['mp4', 'webm', 'mp3'], state='readonly'
+            frm, textvariable=self.format_var, values=FORMATS, state='readonly'
         )
         self.format_combo.grid(row=5, column=1, sticky='we')
 
@@ -137,30 +170,41 @@ class YouTubeDownloaderApp:
             '<<ComboboxSelected>>', lambda e: self.populate_resolutions(self.url.get())
         )
 
+        self.label_workers = ttk.Label(frm)
+        self.label_workers.grid(row=7, column=0, sticky='w')
+        self.workers_spin = ttk.Spinbox(
+            frm, textvariable=self.workers_var, from_=1, to=MAX_PLAYLIST_WORKERS,
+            width=5, state='readonly'
+        )
+        self.workers_spin.grid(row=7, column=1, sticky='we')
+
         self.download_btn = ttk.Button(frm, command=self.download_by_url)
-        self.download_btn.grid(row=7, column=0, columnspan=2, pady=5, sticky='we')
+        self.download_btn.grid(row=8, column=0, columnspan=2, pady=5, sticky='we')
 
         self.label_info = ttk.Label(frm, text="", foreground="gray")
-        self.label_info.grid(row=8, column=0, columnspan=2, sticky='we')
+        self.label_info.grid(row=9, column=0, columnspan=2, sticky='we')
 
         self.progress = ttk.Progressbar(
             frm, orient='horizontal', length=400, mode='determinate'
         )
-        self.progress.grid(row=9, column=0, columnspan=2, pady=5, sticky='we')
+        self.progress.grid(row=10, column=0, columnspan=2, pady=5, sticky='we')
+
+        self.label_status = ttk.Label(frm, text="", foreground="gray")
+        self.label_status.grid(row=11, column=0, columnspan=2, sticky='we')
 
         self.label_lang = ttk.Label(frm)
-        self.label_lang.grid(row=10, column=0, sticky='w')
+        self.label_lang.grid(row=12, column=0, sticky='w')
         self.lang_combo = ttk.Combobox(
-            frm, textvariable=self.lang, values=list(LANG_TEXTS.keys()), state='readonly'
+            frm, textvariable=self.lang, values=available_langs(), state='readonly'
         )
-        self.lang_combo.grid(row=10, column=1, sticky='e')
+        self.lang_combo.grid(row=12, column=1, sticky='e')
 
         self.thumbnail_label = ttk.Label(frm)
-        self.thumbnail_label.grid(row=11, column=0, columnspan=2, pady=12)
-        frm.rowconfigure(11, weight=1)
+        self.thumbnail_label.grid(row=13, column=0, columnspan=2, pady=12)
+        frm.rowconfigure(13, weight=1)
 
-        for i in range(12):
-            frm.rowconfigure(i, weight=1 if i in [1, 3, 9, 11] else 0)
+        for i in range(14):
+            frm.rowconfigure(i, weight=1 if i in [1, 3, 10, 13] else 0)
         self.root.columnconfigure(0, weight=1)
         self.root.rowconfigure(0, weight=1)
 
@@ -169,16 +213,17 @@ class YouTubeDownloaderApp:
         self.label_folder.config(text=self.lang_text('select_folder'))
         self.btn_browse.config(text=self.lang_text('browse'))
         self.btn_load.config(text=self.lang_text('load_video'))
+        self.label_workers.config(text=self.lang_text('playlist_workers'))
         self.download_btn.config(text=self.lang_text('download_video'))
         self.label_lang.config(text=self.lang_text('language_label'))
         self.label_info.config(text="")
 
     def lang_text(self, key):
         lang = self.lang.get()
-        if key in LANG_TEXTS.get(lang, {}):
-            return LANG_TEXTS[lang][key]
-        elif key in LANG_TEXTS.get(DEFAULT_LANG, {}):
-            return LANG_TEXTS[DEFAULT_LANG][key]
+        if key in load_lang(lang):
+            return load_lang(lang)[key]
+        elif key in load_lang(DEFAULT_LANG):
+            return load_lang(DEFAULT_LANG)[key]
         else:
             return key
 
@@ -197,66 +242,161 @@ class YouTubeDownloaderApp:
             title = self.lang_text('error')
         messagebox.showwarning(title, msg)
 
-    def show_error(self, e):
-        log_error(f"{str(e)}\n{traceback.format_exc()}")
-        messagebox.showerror(self.lang_text('error'), f"{str(e)}")
+    def show_error(self, msg):
+        messagebox.showerror(self.lang_text('error'), msg)
+
+    def poll_progress(self):
+        # 工作執行緒只發布事件，所有 Tk 操作都在這裡執行
+        # Worker threads only publish events; every Tk call happens here
+        events, jobs = self.engine.bus.drain()
+        for event in events:
+            kind = event['kind']
+            if kind == 'message':
+                # 語言文字在 Tk 執行緒才查詢，工作執行緒只傳鍵值
+                # Workers send a lang key; it is translated here on the Tk thread
+                text = (
+                    self.lang_text(event['key']).format(**event.get('args', {}))
+                    if 'key' in event else event['text']
+                )
+                show = {'info': self.show_info, 'warning': self.show_warning}
+                show.get(event['level'], self.show_error)(text)
+            elif kind == 'playlist_started':
+                self.download_btn.config(state='disabled')
+                self.playlist_progress = (0, 0)
+            elif kind == 'playlist_progress':
+                self.playlist_progress = (event['done'], event['total'])
+            elif kind == 'playlist_finished':
+                self.download_btn.config(state='normal')
+                self.playlist_progress = None
+            elif kind == 'job_finished' and self.playlist_progress is None:
+                self.progress.config(maximum=1, value=1)
+        self.render_progress(jobs)
+        self.root.after(PROGRESS_POLL_MS, self.poll_progress)
+
+    def render_progress(self, jobs):
+        # 以位元組計算進行中影片的完成比例
+        # Videos still in flight count by the fraction of their bytes received
+        fractions = [
+            min(job['bytes'] / job['total_bytes'], 1.0) for job in jobs if job['total_bytes']
+        ]
+        if self.playlist_progress is not None:
+            done, total = self.playlist_progress
+            self.progress.config(maximum=max(total, 1), value=min(done + sum(fractions), total))
+        elif fractions:
+            self.progress.config(maximum=1, value=sum(fractions) / len(fractions))
+        if jobs:
+            etas = [job['eta'] for job in jobs if job['eta'] is not None]
+            self.label_status.config(text=self.lang_text('progress_status').format(
+                rate=format_bytes(sum(job['bytes_per_sec'] for job in jobs)),
+                eta=format_eta(max(etas) if etas else None)
+            ))
+        elif not self.engine.postprocessor.ready.done():
+            self.label_status.config(text=self.lang_text('ffmpeg_downloading'))
+        else:
+            self.label_status.config(text="")
 
     def show_thumbnail(self, url):
+        from metadata_cache import video_id_from_url
         try:
-            yt = YouTube(url)
-            thumb_url = yt.thumbnail_url
-            response = requests.get(thumb_url, timeout=10)
-            img_data = Image.open(BytesIO(response.content)).resize((320, 180))
-            self.thumbnail_photo = ImageTk.PhotoImage(img_data)
-            self.thumbnail_label.config(image=self.thumbnail_photo, text='')
-        except Exception as e:
-            self.thumbnail_label.config(
-                text=self.lang_text('thumbnail_loading_failed'), image=''
-            )
-            self.thumbnail_photo = None
-            log_error(str(e))
+            video_id = video_id_from_url(url)
+        except ValueError as e:
+            self.thumbnail_failed(e)
+            return
+        self.thumbnail_key = video_id
+        image = self.thumbnails.cached(video_id)
+        if image is not None:
+            self.attach_thumbnail(image)
+            return
+        # 下載與解碼在背景執行，Tk 執行緒只負責貼上完成的圖片
+        # Fetching and decoding happen in the background; the Tk thread only
+        # attaches the finished image in poll_thumbnails
+        future = self.thumbnails.submit(video_id, lambda: self.engine.metadata.get(url).thumbnail_url)
+        future.add_done_callback(lambda f: self.thumbnail_results.put((video_id, f)))
+
+    def poll_thumbnails(self):
+        while True:
+            try:
+                video_id, future = self.thumbnail_results.get_nowait()
+            except queue.Empty:
+                break
+            # 使用者已切換到其他影片時，忽略舊的結果
+            # Ignore results for a video the user has already moved away from
+            if video_id != self.thumbnail_key:
+                continue
+            try:
+                self.attach_thumbnail(future.result())
+            except Exception as e:
+                self.thumbnail_failed(e)
+        self.root.after(THUMBNAIL_POLL_MS, self.poll_thumbnails)
+
+    def attach_thumbnail(self, image):
+        from PIL import ImageTk
+        self.thumbnail_photo = ImageTk.PhotoImage(image)
+        self.thumbnail_label.config(image=self.thumbnail_photo, text='')
+
+    def thumbnail_failed(self, e):
+        self.thumbnail_label.config(
+            text=self.lang_text('thumbnail_loading_failed'), image=''
+        )
+        self.thumbnail_photo = None
+        log_error(str(e))
 
     def populate_resolutions(self, url):
-        try:
-            yt = YouTube(url)
-            fmt = self.format_var.get()
-            if fmt == 'mp3':
-                audio_stream = yt.streams.filter(
-                    only_audio=True, file_extension='mp4'
-                ).order_by('abr').desc().first()
-                if audio_stream is None:
-                    raise Exception("No audio stream found.")
-                self.res_combo['values'] = []
-                self.res_var.set('')
-                return
-            resolutions = set()
-            for s in yt.streams.filter(progressive=True, file_extension=fmt):
-                if s.resolution:
-                    resolutions.add(s.resolution)
-            for s in yt.streams.filter(adaptive=True, only_video=True, file_extension=fmt):
-                if s.resolution:
-                    resolutions.add(s.resolution)
-            res_list = sorted(
-                resolutions, key=lambda x: int(x.replace('p', '')), reverse=True
-            )
+        url = url.strip()
+        self.res_combo['values'] = []
+        self.res_var.set('')
+        if not url:
+            return
+        self.start_backend()
+        # 影片資訊在背景取得，結果由 poll_resolutions 填入下拉選單
+        # Metadata is fetched in the background; poll_resolutions fills the
+        # combobox once it arrives
+        key = (url, self.format_var.get())
+        self.resolution_key = key
+        future = self.metadata_pool.submit(self.resolve_resolutions, *key)
+        future.add_done_callback(lambda f: self.resolution_results.put((key, f)))
+
+    def resolve_resolutions(self, url, fmt):
+        """Runs on a worker thread; returns the resolutions to offer for ``fmt``."""
+        from engine import available_resolutions
+        info = self.engine.metadata.get(url)
+        if fmt == 'mp3':
+            audio_stream = info.streams.filter(
+                only_audio=True, file_extension='mp4'
+            ).order_by('abr').desc().first()
+            if audio_stream is None:
+                raise Exception("No audio stream found.")
+            return []
+        return available_resolutions(info, fmt)
+
+    def poll_resolutions(self):
+        while True:
+            try:
+                key, future = self.resolution_results.get_nowait()
+            except queue.Empty:
+                break
+            # 只採用最新一次查詢的結果
+            # Only the answer to the latest request is used
+            if key != self.resolution_key:
+                continue
+            try:
+                res_list = future.result()
+            except Exception as e:
+                log_error(str(e))
+                continue
             self.res_combo['values'] = res_list
-            if res_list:
-                self.res_var.set(res_list[0])
-            else:
-                self.res_var.set('')
-        except Exception as e:
-            self.res_combo['values'] = []
-            self.res_var.set('')
-            log_error(str(e))
+            self.res_var.set(res_list[0] if res_list else '')
+        self.root.after(THUMBNAIL_POLL_MS, self.poll_resolutions)
 
     def load_playlist_or_video(self):
         url = self.url.get().strip()
         if not url:
             return
-        if "playlist?" in url or "&list=" in url:
+        self.start_backend()
+        if is_playlist_url(url):
             self.label_info.config(text=self.lang_text('playlist_mode_info'))
-            self.show_info(self.lang_text('downloading_playlist'))
-            threading.Thread(target=self.download_playlist, args=(url,)).start()
+            if self.start_playlist(url):
+                self.show_info(self.lang_text('downloading_playlist'))
         else:
             self.label_info.config(text="")
             self.show_thumbnail(url)
@@ -267,157 +407,56 @@ class YouTubeDownloaderApp:
         url = self.url.get().strip()
         if not url:
             return
-        if "playlist?" in url or "&list=" in url:
-            threading.Thread(target=self.download_playlist, args=(url,)).start()
-        else:
-            threading.Thread(target=self.download_single_video, args=(url,)).start()
-
-    def download_single_video(self, url):
+        self.start_backend()
+        if is_playlist_url(url):
+            self.start_playlist(url)
+            return
         folder = self.save_path.get()
         if not folder:
             self.show_warning(self.lang_text('select_folder_first'))
             return
-        try:
-            yt = YouTube(url)
-            video_title = sanitize_filename(yt.title)
-            fmt = self.format_var.get()
-            selected_res = self.res_var.get()
-            final_path = os.path.join(folder, f"{video_title}.{fmt}")
-
-            if fmt == 'mp3':
-                audio_stream = yt.streams.filter(
-                    only_audio=True, file_extension='mp4'
-                ).order_by('abr').desc().first()
-                if audio_stream is None:
-                    raise Exception("No audio stream found.")
-                temp_audio = os.path.join(folder, f"{video_title}_audio.mp4")
-                audio_stream.download(output_path=folder, filename=f"{video_title}_audio.mp4")
-                subprocess.call([
-                    self.ffmpeg_path, '-i', temp_audio, '-vn', '-ab', '192k',
-                    '-ar', '44100', '-y', final_path
-                ])
-                os.remove(temp_audio)
-            else:
-                stream = yt.streams.filter(
-                    progressive=True, file_extension=fmt, resolution=selected_res
-                ).first()
-                if stream:
-                    stream.download(output_path=folder, filename=f"{video_title}.{fmt}")
-                else:
-                    video_stream = yt.streams.filter(
-                        adaptive=True, only_video=True, file_extension=fmt, resolution=selected_res
-                    ).first()
-                    audio_stream = yt.streams.filter(
-                        adaptive=True, only_audio=True, file_extension='mp4'
-                    ).order_by('abr').desc().first()
-                    if video_stream and audio_stream:
-                        video_path = video_stream.download(
-                            output_path=folder, filename=f"video_{video_title}.mp4"
-                        )
-                        audio_path = audio_stream.download(
-                            output_path=folder, filename=f"audio_{video_title}.mp4"
-                        )
-                        subprocess.call([
-                            self.ffmpeg_path, '-i', video_path, '-i', audio_path,
-                            '-c:v', 'copy', '-c:a', 'aac', final_path
-                        ])
-                        os.remove(video_path)
-                        os.remove(audio_path)
-                    else:
-                        raise Exception("No suitable stream found.")
-            self.show_info(self.lang_text('download_complete'))
-        except Exception as e:
-            self.show_error(e)
+        self.jobs.enqueue('video', url, folder, self.format_var.get(), self.res_var.get())
+        self.runner.notify()
 
-    def download_playlist(self, url):
+    def start_playlist(self, url):
+        folder = self.save_path.get()
+        if not folder:
+            self.show_warning(self.lang_text('select_folder_first'))
+            return False
+        self.jobs.enqueue(
+            'playlist', url, folder, self.format_var.get(), workers=self.playlist_workers()
+        )
+        self.runner.notify()
+        return True
+
+    def playlist_workers(self):
         try:
-            playlist = Playlist(url)
-            folder = self.save_path.get()
-            if not folder:
-                self.show_warning(self.lang_text('select_folder_first'))
-                return
-            total_videos = len(playlist.video_urls)
-            self.progress.config(maximum=total_videos, value=0)
-            self.download_btn.config(state='disabled')
-
-            for index, video_url in enumerate(playlist.video_urls):
-                try:
-                    yt = YouTube(video_url)
-                    video_title = sanitize_filename(f"{index+1:02d}_{yt.title}")
-                    fmt = self.format_var.get()
-                    final_path = os.path.join(
-                        folder, f"{video_title}.{fmt if fmt != 'mp3' else 'mp3'}"
-                    )
-                    if os.path.exists(final_path):
-                        self.progress['value'] += 1
-                        self.root.update_idletasks()
-                        continue
-                    if fmt == 'mp3':
-                        audio_stream = yt.streams.filter(
-                            only_audio=True, file_extension='mp4'
-                        ).order_by('abr').desc().first()
-                        if audio_stream is None:
-                            log_error(f"{video_title} failed: no audio stream found")
-                            self.progress['value'] += 1
-                            self.root.update_idletasks()
-                            continue
-                        temp_audio = os.path.join(folder, f"{video_title}_audio.mp4")
-                        audio_stream.download(output_path=folder, filename=f"{video_title}_audio.mp4")
-                        subprocess.call([
-                            self.ffmpeg_path, '-i', temp_audio, '-vn', '-ab', '192k',
-                            '-ar', '44100', '-y', final_path
-                        ])
-                        os.remove(temp_audio)
-                    else:
-                        video_stream = yt.streams.filter(
-                            adaptive=True, only_video=True, file_extension=fmt
-                        ).order_by('resolution').desc().first()
-                        audio_stream = yt.streams.filter(
-                            adaptive=True, only_audio=True, file_extension='mp4'
-                        ).order_by('abr').desc().first()
-                        if video_stream and audio_stream:
-                            video_path = video_stream.download(
-                                output_path=folder, filename_prefix='video_'
-                            )
-                            audio_path = audio_stream.download(
-                                output_path=folder, filename_prefix='audio_'
-                            )
-                            subprocess.call([
-                                self.ffmpeg_path, '-i', video_path, '-i', audio_path,
-                                '-c:v', 'copy', '-c:a', 'aac', final_path
-                            ])
-                            os.remove(video_path)
-                            os.remove(audio_path)
-                        else:
-                            stream = yt.streams.filter(
-                                progressive=True, file_extension=fmt
-                            ).order_by('resolution').desc().first()
-                            if stream:
-                                stream.download(output_path=folder, filename=f"{video_title}.{fmt}")
-                            else:
-                                log_error(f"{video_title} failed: no suitable stream found")
-                    self.progress['value'] += 1
-                    self.root.update_idletasks()
-                except Exception as e:
-                    log_error(
-                        f"Failed to download video {video_url}: {str(e)}\n{traceback.format_exc()}"
-                    )
-
-            self.download_btn.config(state='normal')
-            self.show_info(self.lang_text('playlist_complete'))
-        except Exception as e:
-            self.show_error(e)
+            workers = int(self.workers_var.get())
+        except (tk.TclError, ValueError):
+            workers = DEFAULT_PLAYLIST_WORKERS
+        return max(1, min(workers, MAX_PLAYLIST_WORKERS))
 
 
 def main():
-    ffmpeg_path = ensure_ffmpeg()
-    if ffmpeg_path is None:
-        root = tk.Tk()
-        root.withdraw()
-        messagebox.showerror("FFmpeg Error", "自動下載 FFmpeg 失敗，請手動安裝到 assets 目錄。")
-        sys.exit(1)
+    startup_profile.checkpoint('imports')
     root = tk.Tk()
-    app = YouTubeDownloaderApp(root, ffmpeg_path=ffmpeg_path)
+    app = YouTubeDownloaderApp(root)
+    startup_profile.checkpoint('create window')
+    # 先把視窗畫出來，再載入下載核心；FFmpeg 也在這之後才於背景檢查與下載
+    # Draw the window first, then load the backend; ffmpeg is checked and
+    # downloaded in the background only after that
+    root.update()
+    startup_profile.checkpoint('first window')
+    if startup_profile.requested():
+        # 分析模式只計時匯入，不啟動佇列、FFmpeg 檢查與清理
+        # Profiling only times the imports; it never starts the job queue,
+        # the ffmpeg check or the store cleanup
+        import_backend()
+        startup_profile.checkpoint('backend imports')
+        startup_profile.report(STARTUP_PROFILE_PATH)
+        root.destroy()
+        return
+    app.start_backend()
     root.mainloop()
 
 
@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import threading
+
+# Linux 的 FICLONE ioctl：在 btrfs、XFS 等檔案系統上建立共用資料區塊的副本
+# Linux FICLONE ioctl: a copy that shares data blocks on btrfs, XFS and similar
+FICLONE = 0x40049409
+
+
+def reflink(src, dst):
+    """Clone ``src`` to ``dst`` without copying data; raises OSError where unsupported."""
+    if not sys.platform.startswith('linux'):
+        raise OSError("reflink is not supported on this platform")
+    import fcntl
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+
+def place_file(src, dst):
+    """Make ``dst`` hold the content of ``src``: hardlink, else reflink, else copy.
+
+    The file appears under a temp name and is renamed into place, so ``dst``
+    never exists half-written. Returns how it was placed.
+    """
+    tmp = dst + ".store.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        os.link(src, tmp)
+        method = 'hardlink'
+    except OSError:
+        try:
+            reflink(src, tmp)
+            method = 'reflink'
+        except OSError:
+            shutil.copyfile(src, tmp)
+            method = 'copy'
+    os.replace(tmp, dst)
+    return method
+
+
+def current_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+class MediaStore:
+    """Index of finished playlist videos, keyed by video ID, format and resolution.
+
+    The store keeps no copy of its own: its entries are the downloaded files
+    themselves, wherever they were saved, so it costs no disk space on any
+    filesystem. When another playlist needs the same video it is hardlinked
+    from one of them (or reflinked, or copied onto another drive) instead of
+    downloaded and muxed again. Every placed file is one reference; an entry
+    whose file was deleted or changed size is dropped, and a video is
+    forgotten once it has no references left. Hardlinks share one file on
+    disk, so editing one edits them all.
+    """
+
+    def __init__(self, root):
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(root, "store.sqlite3"), check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " path TEXT PRIMARY KEY, video_id TEXT NOT NULL, fmt TEXT NOT NULL,"
+                " resolution TEXT NOT NULL, title TEXT NOT NULL, size INTEGER NOT NULL,"
+                " added_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS files_key ON files (video_id, fmt, resolution)"
+            )
+
+    def lookup(self, video_id, fmt, resolution):
+        """Return ``(title, path)`` of an intact copy of this video, or None."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT path, title, size FROM files"
+                " WHERE video_id = ? AND fmt = ? AND resolution = ? ORDER BY added_at",
+                (video_id, fmt, resolution)
+            ).fetchall()
+        stale = []
+        for path, title, size in rows:
+            if current_size(path) == size:
+                self.forget(stale)
+                return title, path
+            stale.append(path)
+        # 已刪除或被改動的檔案不再當作來源
+        # Deleted or modified files are no longer used as a source
+        self.forget(stale)
+        return None
+
+    def place(self, video_id, fmt, resolution, title, src, dst):
+        """Put a copy of ``src`` at ``dst`` and count it as another reference."""
+        method = place_file(src, dst)
+        self.add(video_id, fmt, resolution, dst, title)
+        return method
+
+    def add(self, video_id, fmt, resolution, path, title):
+        """Record the finished file at ``path`` as a reference to this video."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), video_id, fmt, resolution, title,
+                 os.path.getsize(path), time.time())
+            )
+
+    def forget(self, paths):
+        if not paths:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in paths])
+
+    def collect(self):
+        """Drop references whose files were deleted or changed; returns how many."""
+        with self.lock:
+            rows = self.conn.execute("SELECT path, size FROM files").fetchall()
+        stale = [path for path, size in rows if current_size(path) != size]
+        self.forget(stale)
+        return len(stale)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
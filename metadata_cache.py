@@ -0,0 +1,278 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+from pytubefix import YouTube
+
+# 串流網址約 6 小時後失效，預留 10 分鐘避免下載到一半過期
+# Stream URLs expire after ~6 hours; keep a 10 minute margin so a download
+# never starts on a URL that is about to die
+EXPIRY_MARGIN = 10 * 60
+DEFAULT_TTL = 60 * 60
+DEFAULT_MAX_ENTRIES = 256
+
+VIDEO_ID_RE = re.compile(r"(?:v=|/)([0-9A-Za-z_-]{11})")
+
+
+def video_id_from_url(url):
+    match = VIDEO_ID_RE.search(url)
+    if match is None:
+        raise ValueError(f"Could not find a video id in {url}")
+    return match.group(1)
+
+
+class CachedStream:
+    """Plain-data copy of a pytubefix ``Stream`` that survives a trip to disk."""
+
+    FIELDS = (
+        'url', 'itag', 'mime_type', 'type', 'subtype', 'resolution', 'abr',
+        'video_codec', 'audio_codec', 'is_progressive', 'filesize'
+    )
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_stream(cls, stream):
+        return cls(
+            url=stream.url, itag=stream.itag, mime_type=stream.mime_type,
+            type=stream.type, subtype=stream.subtype, resolution=stream.resolution,
+            abr=stream.abr, video_codec=stream.video_codec, audio_codec=stream.audio_codec,
+            is_progressive=stream.is_progressive, filesize=stream._filesize or None
+        )
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @property
+    def is_adaptive(self):
+        return not self.is_progressive
+
+    @property
+    def includes_audio_track(self):
+        return self.is_progressive or self.type == 'audio'
+
+    @property
+    def includes_video_track(self):
+        return self.is_progressive or self.type == 'video'
+
+    @property
+    def expires_at(self):
+        expire = parse_qs(urlparse(self.url).query).get('expire')
+        return int(expire[0]) if expire and expire[0].isdigit() else None
+
+    def __repr__(self):
+        return f"<CachedStream itag={self.itag} mime_type={self.mime_type} res={self.resolution} abr={self.abr}>"
+
+
+class StreamTable:
+    """The subset of pytubefix's ``StreamQuery`` that the downloader uses."""
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+
+    def filter(self, progressive=None, adaptive=None, only_audio=None, only_video=None,
+               file_extension=None, resolution=None):
+        checks = []
+        if progressive:
+            checks.append(lambda s: s.is_progressive)
+        if adaptive:
+            checks.append(lambda s: s.is_adaptive)
+        if only_audio:
+            checks.append(lambda s: s.includes_audio_track and not s.includes_video_track)
+        if only_video:
+            checks.append(lambda s: s.includes_video_track and not s.includes_audio_track)
+        if file_extension:
+            checks.append(lambda s: s.subtype == file_extension)
+        if resolution:
+            checks.append(lambda s: s.resolution == resolution)
+        return StreamTable(s for s in self.streams if all(check(s) for check in checks))
+
+    def order_by(self, attribute_name):
+        def key(s):
+            digits = ''.join(filter(str.isdigit, str(getattr(s, attribute_name))))
+            return int(digits) if digits else 0
+        return StreamTable(sorted(
+            (s for s in self.streams if getattr(s, attribute_name) is not None), key=key
+        ))
+
+    def desc(self):
+        return StreamTable(reversed(self.streams))
+
+    def asc(self):
+        return self
+
+    def first(self):
+        return self.streams[0] if self.streams else None
+
+    def __iter__(self):
+        return iter(self.streams)
+
+    def __len__(self):
+        return len(self.streams)
+
+
+class VideoInfo:
+    def __init__(self, video_id, title, thumbnail_url, streams, expires_at):
+        self.video_id = video_id
+        self.title = title
+        self.thumbnail_url = thumbnail_url
+        self.streams = StreamTable(streams)
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_youtube(cls, video_id, yt):
+        streams = [CachedStream.from_stream(s) for s in yt.streams]
+        expiries = [s.expires_at for s in streams if s.expires_at]
+        if expiries:
+            expires_at = min(expiries) - EXPIRY_MARGIN
+        else:
+            expires_at = time.time() + DEFAULT_TTL
+        return cls(video_id, yt.title, yt.thumbnail_url, streams, expires_at)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['video_id'], data['title'], data['thumbnail_url'],
+            [CachedStream(**s) for s in data['streams']], data['expires_at']
+        )
+
+    def to_dict(self):
+        return {
+            'video_id': self.video_id, 'title': self.title,
+            'thumbnail_url': self.thumbnail_url,
+            'streams': [s.to_dict() for s in self.streams],
+            'expires_at': self.expires_at,
+        }
+
+    def is_fresh(self):
+        return time.time() < self.expires_at
+
+
+class MetadataCache:
+    """Video title, thumbnail URL and stream table, keyed by video ID.
+
+    Entries live in memory and as one JSON file per video under ``cache_dir``.
+    Both layers are LRU-bounded by ``max_entries`` and an entry is dropped once
+    its stream URLs are about to expire. Concurrent lookups of the same video
+    share a single ``YouTube(url)`` fetch.
+    """
+
+    def __init__(self, cache_dir, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.fetch_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, url):
+        video_id = video_id_from_url(url)
+        info = self.lookup(video_id)
+        if info is not None:
+            return info
+        with self.lock:
+            fetch_lock = self.fetch_locks.setdefault(video_id, threading.Lock())
+        with fetch_lock:
+            # 另一個執行緒可能剛抓完同一部影片
+            # Another thread may have fetched this video while we waited
+            info = self.lookup(video_id)
+            if info is None:
+                info = VideoInfo.from_youtube(video_id, YouTube(url))
+                self.store(info)
+        with self.lock:
+            self.fetch_locks.pop(video_id, None)
+        return info
+
+    def lookup(self, video_id):
+        with self.lock:
+            info = self.entries.get(video_id)
+            if info is not None:
+                if info.is_fresh():
+                    self.entries.move_to_end(video_id)
+                    return info
+                del self.entries[video_id]
+        info = self.load(video_id)
+        if info is None:
+            return None
+        with self.lock:
+            self.entries[video_id] = info
+            self.evict_memory()
+        return info
+
+    def invalidate(self, video_id):
+        with self.lock:
+            self.entries.pop(video_id, None)
+        try:
+            os.remove(self.path_for(video_id))
+        except OSError:
+            pass
+
+    def store(self, info):
+        with self.lock:
+            self.entries[info.video_id] = info
+            self.evict_memory()
+        path = self.path_for(info.video_id)
+        # 每個執行緒用自己的暫存檔，同一部影片同時寫入也不會互相覆蓋
+        # A temp file per thread, so concurrent stores of one video never collide
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(info.to_dict(), f)
+        os.replace(tmp_path, path)
+        self.evict_disk()
+
+    def load(self, video_id):
+        path = self.path_for(video_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                info = VideoInfo.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError, TypeError):
+            info = None
+        if info is None or not info.is_fresh():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        # 以修改時間記錄最近使用，供磁碟 LRU 淘汰
+        # The file mtime doubles as the on-disk LRU timestamp; another thread
+        # may have evicted the file since it was read
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return info
+
+    def evict_memory(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def evict_disk(self):
+        # 其他執行緒可能同時刪除檔案，消失的檔案直接略過
+        # Other threads may remove files meanwhile; files that vanish are skipped
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.json'):
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    continue
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def path_for(self, video_id):
+        return os.path.join(self.cache_dir, f"{video_id}.json")
@@ -0,0 +1,56 @@
+# 各容器可直接複製（不重新編碼）的編碼格式
+# Codecs each container can take as a plain stream copy, without re-encoding
+CONTAINER_CODECS = {
+    'mp4': {'video': {'avc1', 'hev1', 'hvc1', 'av01', 'vp9'}, 'audio': {'mp4a'}},
+    'webm': {'video': {'vp8', 'vp9', 'av01'}, 'audio': {'opus', 'vorbis'}},
+}
+
+# 無法直接複製時使用的編碼器
+# Encoders used when a track has to be transcoded to fit the container
+FALLBACK_ENCODERS = {
+    'mp4': {'video': ['-c:v', 'libx264'], 'audio': ['-c:a', 'aac', '-b:a', '192k']},
+    'webm': {'video': ['-c:v', 'libvpx-vp9'], 'audio': ['-c:a', 'libopus', '-b:a', '160k']},
+}
+
+
+def codec_family(codec):
+    """``'avc1.640028'`` -> ``'avc1'``, ``'vp09.00.40.08'`` -> ``'vp9'``."""
+    if not codec:
+        return None
+    family = codec.split('.')[0].lower()
+    return 'vp9' if family == 'vp09' else family
+
+
+def can_copy(fmt, kind, codec):
+    return codec_family(codec) in CONTAINER_CODECS.get(fmt, {}).get(kind, set())
+
+
+def choose_audio(streams, fmt):
+    """Pick the best audio-only stream for ``fmt``.
+
+    Streams whose codec the container takes as-is (AAC for mp4, opus for webm)
+    win over higher-bitrate ones that would need re-encoding.
+    """
+    candidates = streams.filter(adaptive=True, only_audio=True).order_by('abr').desc()
+    for stream in candidates:
+        if can_copy(fmt, 'audio', stream.audio_codec):
+            return stream
+    return candidates.first()
+
+
+def plan_mux(video_stream, audio_stream, video_path, audio_path, final_path, fmt):
+    """Return the ffmpeg arguments that merge the two tracks into ``final_path``.
+
+    Each track is copied when ``fmt`` can hold its codec and only transcoded
+    otherwise, so the common case is a pure ``-c copy`` remux.
+    """
+    copy_video = can_copy(fmt, 'video', video_stream.video_codec)
+    copy_audio = can_copy(fmt, 'audio', audio_stream.audio_codec)
+    args = ['-i', video_path, '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0']
+    if copy_video and copy_audio:
+        args += ['-c', 'copy']
+    else:
+        encoders = FALLBACK_ENCODERS.get(fmt, FALLBACK_ENCODERS['mp4'])
+        args += ['-c:v', 'copy'] if copy_video else encoders['video']
+        args += ['-c:a', 'copy'] if copy_audio else encoders['audio']
+    return args + ['-y', final_path]
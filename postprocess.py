@@ -0,0 +1,154 @@
+import os
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+# ffmpeg 以 key=value 格式把進度寫到 stdout，其餘輸出只保留錯誤
+# ffmpeg writes key=value progress lines to stdout and only errors to stderr
+PROGRESS_ARGS = ['-hide_banner', '-loglevel', 'error', '-nostats', '-progress', 'pipe:1']
+# 串流轉檔大多在等網路，另設較大的上限，不佔用 CPU 名額
+# Streamed transcodes mostly wait on the network, so they have their own,
+# larger limit instead of taking CPU slots
+DEFAULT_PIPE_WORKERS = 16
+
+
+class FFmpegUnavailable(Exception):
+    pass
+
+
+def read_progress(stdout, job):
+    """Forward ffmpeg's ``out_time_us`` progress lines to ``job.encoded``."""
+    for line in stdout:
+        key, _, value = line.decode('utf-8', 'replace').strip().partition('=')
+        if job and key == 'out_time_us' and value.isdigit():
+            job.encoded(int(value) / 1_000_000)
+
+
+class PostProcessor:
+    """Runs ffmpeg jobs in the background so downloads never wait on muxing.
+
+    Jobs are queued on a pool with one slot per CPU core; every slot drives its
+    own ffmpeg process, so at most ``workers`` encodes run at the same time.
+    Streamed transcodes (``pipe``) are paced by their download, so they are
+    bounded separately by ``pipe_workers`` and never hold up queued jobs.
+    Passing a progress ``job`` records queue wait and ffmpeg time as stages and
+    reports how far ffmpeg has got. If ``ready`` is a Future, jobs wait for it
+    first, so downloads can start while ffmpeg itself is still being installed.
+    ``bootstrap`` returns a fresh Future and is used to retry a failed install.
+    """
+
+    def __init__(self, ffmpeg_path, workers=None, ready=None, pipe_workers=None, bootstrap=None):
+        self.ffmpeg_path = ffmpeg_path
+        self.ready = ready
+        self.bootstrap = bootstrap
+        self.ready_lock = threading.Lock()
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='ffmpeg'
+        )
+        self.pipe_slots = threading.BoundedSemaphore(
+            pipe_workers or max(self.workers, DEFAULT_PIPE_WORKERS)
+        )
+
+    def wait_ready(self):
+        """Block until ffmpeg is installed; raises ``FFmpegUnavailable`` if the install failed."""
+        if self.ready is not None:
+            try:
+                self.ready.result()
+            except Exception as e:
+                raise FFmpegUnavailable(f"ffmpeg is not installed: {e}") from e
+
+    def check_ready(self):
+        """Fail fast, before any download, when the ffmpeg install has failed.
+
+        Does not wait for an install still in progress. A failed install is
+        started again through ``bootstrap``, so the next attempt can use it.
+        """
+        with self.ready_lock:
+            ready = self.ready
+            if ready is None or not ready.done() or ready.exception() is None:
+                return
+            if self.bootstrap is not None:
+                self.ready = self.bootstrap()
+        raise FFmpegUnavailable(f"ffmpeg is not installed: {ready.exception()}")
+
+    def command(self, args):
+        return [self.ffmpeg_path] + PROGRESS_ARGS + list(args)
+
+    def submit(self, args, temp_files=(), output=None, job=None, stage='mux'):
+        """Queue ``ffmpeg <args>`` and return a Future for its completion.
+
+        ``temp_files`` are removed once ffmpeg exits, whether it succeeded or not.
+        If ffmpeg never ran because it could not be installed, they are kept, so
+        a retry does not have to download them again.
+        """
+        if job:
+            job.begin(f"{stage}_queue")
+        return self.pool.submit(self._run, list(args), list(temp_files), output, job, stage)
+
+    def pipe(self, args, chunks, output=None, job=None, stage='transcode'):
+        """Run ``ffmpeg <args>`` on the caller's thread, feeding ``chunks`` to stdin.
+
+        ``args`` should read its input from ``pipe:0``. ffmpeg starts encoding as
+        soon as the first chunk arrives, so nothing is written to a temp file. A
+        partial ``output`` is removed if ffmpeg fails.
+        """
+        self.wait_ready()
+        with self.pipe_slots:
+            if job:
+                job.begin(stage)
+            proc = subprocess.Popen(
+                self.command(args), stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+            # stdin 寫入時另開執行緒讀取進度，避免管線互相卡住
+            # Read progress on another thread so a full stdout pipe never blocks stdin
+            reader = threading.Thread(target=read_progress, args=(proc.stdout, job), daemon=True)
+            reader.start()
+            try:
+                for chunk in chunks:
+                    proc.stdin.write(chunk)
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                self._discard(output)
+                raise
+            finally:
+                code = proc.wait()
+                reader.join()
+                if job:
+                    job.end(stage)
+        if code != 0:
+            self._discard(output)
+            raise RuntimeError(f"ffmpeg exited with code {code} for {output}")
+        return output
+
+    def _discard(self, path):
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def _run(self, args, temp_files, output, job, stage):
+        self.wait_ready()
+        try:
+            if job:
+                job.end(f"{stage}_queue")
+                job.begin(stage)
+            proc = subprocess.Popen(
+                self.command(args), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE
+            )
+            read_progress(proc.stdout, job)
+            code = proc.wait()
+            if job:
+                job.end(stage)
+        finally:
+            for path in temp_files:
+                if os.path.exists(path):
+                    os.remove(path)
+        if code != 0:
+            raise RuntimeError(f"ffmpeg exited with code {code} for {output}")
+        return output
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import queue
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# 計算速度時只看最近幾秒的取樣
+# Throughput is measured over the last few seconds of samples
+RATE_WINDOW = 5.0
+SAMPLE_INTERVAL = 0.5
+
+
+class Job:
+    """Progress of one video: bytes per stream, stage timings and ffmpeg position.
+
+    Workers update it as often as they like; nothing here touches the UI, which
+    reads snapshots through ``ProgressBus.drain``.
+    """
+
+    def __init__(self, bus, job_id, label, priority=0):
+        self.bus = bus
+        self.id = job_id
+        self.label = label
+        self.priority = priority
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.streams = {}
+        self.samples = deque()
+        self.stage = None
+        self.stage_starts = {}
+        self.stage_times = {}
+        self.encoded_seconds = None
+        self.first_byte = None
+        self.temp_files = set()
+        self.on_stage = None
+
+    @contextmanager
+    def timed(self, stage):
+        self.begin(stage)
+        try:
+            yield
+        finally:
+            self.end(stage)
+
+    def begin(self, stage):
+        with self.lock:
+            self.stage = stage
+            self.stage_starts[stage] = time.monotonic()
+        if self.on_stage:
+            self.on_stage(self, stage)
+
+    def end(self, stage):
+        with self.lock:
+            start = self.stage_starts.pop(stage, None)
+            if start is not None:
+                self.stage_times[stage] = self.stage_times.get(stage, 0.0) + time.monotonic() - start
+
+    def add_temp(self, path):
+        """Remember an intermediate file, so a crashed job can reuse or remove it."""
+        with self.lock:
+            self.temp_files.add(path)
+
+    def bytes_callback(self, key):
+        """Return an ``on_progress(done, total)`` callback for one stream of this job."""
+        return lambda done, total: self.update_bytes(key, done, total)
+
+    def update_bytes(self, key, done, total):
+        now = time.monotonic()
+        with self.lock:
+            self.streams[key] = (done, total)
+            if self.first_byte is None and done:
+                self.first_byte = now - self.started
+            if not self.samples or now - self.samples[-1][0] >= SAMPLE_INTERVAL:
+                self.samples.append((now, self.bytes_done()))
+                while self.samples and now - self.samples[0][0] > RATE_WINDOW:
+                    self.samples.popleft()
+
+    def encoded(self, seconds):
+        with self.lock:
+            self.encoded_seconds = seconds
+
+    def bytes_done(self):
+        return sum(done for done, _ in self.streams.values())
+
+    def bytes_total(self):
+        totals = [total for _, total in self.streams.values()]
+        return sum(totals) if totals and all(totals) else None
+
+    def snapshot(self):
+        with self.lock:
+            done = self.bytes_done()
+            total = self.bytes_total()
+            rate = 0.0
+            if len(self.samples) >= 2:
+                (t0, b0), (t1, b1) = self.samples[0], self.samples[-1]
+                if t1 > t0:
+                    rate = (b1 - b0) / (t1 - t0)
+            eta = (total - done) / rate if total and rate > 0 else None
+            return {
+                'job': self.id, 'label': self.label, 'priority': self.priority, 'stage': self.stage,
+                'bytes': done, 'total_bytes': total, 'bytes_per_sec': rate, 'eta': eta,
+                'encoded_seconds': self.encoded_seconds, 'ttfb': self.first_byte,
+                'elapsed': time.monotonic() - self.started,
+                'stages': dict(self.stage_times),
+            }
+
+    def finish(self, error=None):
+        self.bus.finish_job(self, error)
+
+
+class ProgressBus:
+    """Thread-safe channel from download workers to whoever shows progress.
+
+    Workers publish discrete events (messages, playlist counts, finished jobs)
+    and update ``Job`` objects in place. The consumer calls ``drain`` on its own
+    schedule, e.g. from Tk's ``after()``, so the UI refreshes at a fixed rate no
+    matter how fast bytes arrive. Finished jobs are also appended as one JSON
+    line each to ``metrics_path``.
+    """
+
+    def __init__(self, metrics_path=None):
+        self.metrics_path = metrics_path
+        self.events = queue.Queue()
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.metrics_lock = threading.Lock()
+
+    def publish(self, kind, **fields):
+        self.events.put({'kind': kind, 'time': time.time(), **fields})
+
+    def message(self, level, text):
+        """Queue a user-facing ``info``, ``warning`` or ``error`` message."""
+        self.publish('message', level=level, text=text)
+
+    def start_job(self, label, priority=0):
+        with self.lock:
+            job = Job(self, next(self.ids), label, priority)
+            self.jobs[job.id] = job
+        self.publish('job_started', job=job.id, label=label)
+        return job
+
+    def finish_job(self, job, error=None):
+        with self.lock:
+            self.jobs.pop(job.id, None)
+        record = job.snapshot()
+        record.update(
+            ok=error is None, error=str(error) if error else None,
+            avg_bytes_per_sec=record['bytes'] / record['elapsed'] if record['elapsed'] else 0.0
+        )
+        self.publish('job_finished', **record)
+        self.write_metrics(record)
+
+    def drain(self):
+        """Return ``(events, active_jobs)``: queued events and a snapshot of each running job."""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                break
+        with self.lock:
+            jobs = list(self.jobs.values())
+        return events, [job.snapshot() for job in jobs]
+
+    def write_metrics(self, record):
+        if not self.metrics_path:
+            return
+        line = json.dumps({'time': time.strftime('%Y-%m-%d %H:%M:%S'), **record})
+        with self.metrics_lock:
+            os.makedirs(os.path.dirname(self.metrics_path), exist_ok=True)
+            with open(self.metrics_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return f"{n:.1f} {unit}" if unit != 'B' else f"{int(n)} B"
+        n /= 1024
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
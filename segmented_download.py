@@ -0,0 +1,205 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import http_client
+
+# 每段大小與同時連線數
+# Size of each Range segment and number of parallel connections
+DEFAULT_SEGMENT_SIZE = 8 * 1024 * 1024
+DEFAULT_CONNECTIONS = 4
+CHUNK_SIZE = 64 * 1024
+SEGMENT_RETRIES = 3
+
+
+class DownloadError(Exception):
+    pass
+
+
+def part_paths(dest):
+    """Return ``(part_path, manifest_path)`` used while ``dest`` is in flight."""
+    return dest + ".part", dest + ".part.json"
+
+
+def probe(session, url, timeout=None):
+    """Return ``(size, accepts_ranges)`` for ``url``; size is None if unknown."""
+    r = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=timeout)
+    try:
+        r.raise_for_status()
+        if r.status_code == 206:
+            content_range = r.headers.get("Content-Range", "")
+            total = content_range.rsplit("/", 1)[-1]
+            return (int(total) if total.isdigit() else None), True
+        length = r.headers.get("Content-Length")
+        return (int(length) if length else None), False
+    finally:
+        r.close()
+
+
+def split_segments(size, segment_size):
+    return [
+        (start, min(start + segment_size, size) - 1)
+        for start in range(0, size, segment_size)
+    ]
+
+
+def load_manifest(manifest_path, part_path, size, segment_size):
+    """Return the set of finished segment starts, or None if nothing can be resumed."""
+    if not (os.path.exists(manifest_path) and os.path.exists(part_path)):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("size") != size or manifest.get("segment_size") != segment_size:
+        return None
+    if os.path.getsize(part_path) != size:
+        return None
+    return set(manifest.get("done", []))
+
+
+def save_manifest(manifest_path, url, size, segment_size, done):
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {"url": url, "size": size, "segment_size": segment_size, "done": sorted(done)}, f
+        )
+    os.replace(tmp_path, manifest_path)
+
+
+def download(url, dest, connections=DEFAULT_CONNECTIONS, segment_size=DEFAULT_SEGMENT_SIZE,
+             on_progress=None, session=None, timeout=None, throttle=None):
+    """Download ``url`` to ``dest`` over several HTTP Range connections.
+
+    Segments are written into a preallocated ``dest.part`` file and every
+    finished segment is recorded in ``dest.part.json``, so calling this again
+    after a crash only fetches the segments that are still missing. Servers
+    without Range support fall back to a single plain GET.
+
+    ``on_progress(bytes_done, total)`` is called from the worker threads, and
+    ``throttle(n)`` before each chunk is written, so it can hold the transfer
+    back to a bandwidth limit. Requests go through the shared pooled
+    transport unless a ``session`` is given, and use its timeout unless
+    ``timeout`` is set. Returns ``dest``.
+    """
+    session = session or http_client.session()
+    size, accepts_ranges = probe(session, url, timeout)
+    if not size or not accepts_ranges:
+        return download_single(session, url, dest, size, on_progress, timeout, throttle)
+    return download_segmented(
+        session, url, dest, size, connections, segment_size, on_progress, timeout, throttle
+    )
+
+
+def iter_content(url, segment_size=DEFAULT_SEGMENT_SIZE, on_progress=None, session=None,
+                 timeout=None, throttle=None):
+    """Yield the body of ``url`` in order, without writing anything to disk.
+
+    The body is requested one Range segment at a time, which keeps each request
+    small, and as a plain GET when the server has no Range support.
+    """
+    session = session or http_client.session()
+    size, accepts_ranges = probe(session, url, timeout)
+    if size and accepts_ranges:
+        ranges = [{"Range": f"bytes={start}-{end}"}
+                  for start, end in split_segments(size, segment_size)]
+    else:
+        ranges = [None]
+    done_bytes = 0
+    for headers in ranges:
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if throttle:
+                    throttle(len(chunk))
+                done_bytes += len(chunk)
+                if on_progress:
+                    on_progress(done_bytes, size)
+                yield chunk
+
+
+def download_single(session, url, dest, size, on_progress, timeout, throttle=None):
+    part_path, _ = part_paths(dest)
+    done_bytes = 0
+    with session.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(part_path, "wb") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                if throttle:
+                    throttle(len(chunk))
+                f.write(chunk)
+                done_bytes += len(chunk)
+                if on_progress:
+                    on_progress(done_bytes, size)
+    os.replace(part_path, dest)
+    return dest
+
+
+def download_segmented(session, url, dest, size, connections, segment_size, on_progress, timeout,
+                       throttle=None):
+    part_path, manifest_path = part_paths(dest)
+    segments = split_segments(size, segment_size)
+    done = load_manifest(manifest_path, part_path, size, segment_size)
+    if done is None:
+        # 預先配置完整大小，各段可直接寫入自己的位置
+        # Preallocate the full size so every segment can write at its own offset
+        with open(part_path, "wb") as f:
+            f.truncate(size)
+        done = set()
+        save_manifest(manifest_path, url, size, segment_size, done)
+
+    lock = threading.Lock()
+    state = {"bytes": sum(end - start + 1 for start, end in segments if start in done)}
+    if on_progress:
+        on_progress(state["bytes"], size)
+
+    def report(n):
+        with lock:
+            state["bytes"] += n
+            current = state["bytes"]
+        if on_progress:
+            on_progress(current, size)
+
+    def fetch(segment):
+        start, end = segment
+        for attempt in range(SEGMENT_RETRIES):
+            written = 0
+            try:
+                headers = {"Range": f"bytes={start}-{end}"}
+                with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+                    r.raise_for_status()
+                    if r.status_code != 206:
+                        raise DownloadError(f"Server ignored Range request for {url}")
+                    with open(part_path, "r+b") as f:
+                        f.seek(start)
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            if throttle:
+                                throttle(len(chunk))
+                            f.write(chunk)
+                            written += len(chunk)
+                            report(len(chunk))
+                if written != end - start + 1:
+                    raise DownloadError(
+                        f"Segment {start}-{end} ended after {written} bytes"
+                    )
+                break
+            except (requests.RequestException, DownloadError):
+                report(-written)
+                if attempt == SEGMENT_RETRIES - 1:
+                    raise
+        with lock:
+            done.add(start)
+            save_manifest(manifest_path, url, size, segment_size, done)
+
+    pending = [segment for segment in segments if segment[0] not in done]
+    with ThreadPoolExecutor(max_workers=max(1, connections)) as pool:
+        for future in [pool.submit(fetch, segment) for segment in pending]:
+            future.result()
+
+    os.replace(part_path, dest)
+    os.remove(manifest_path)
+    return dest
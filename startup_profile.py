@@ -0,0 +1,97 @@
+"""Startup profiling: time per startup phase and per imported module.
+
+Enabled by running ``python main.py --profile-startup`` (or setting
+``YTDL_PROFILE_STARTUP=1``). This module must be imported before anything
+heavy, since only imports made after ``enable_if_requested`` are timed.
+"""
+import os
+import sys
+import time
+import builtins
+import threading
+
+# 報告中列出的最慢匯入數量
+# How many of the slowest imports the report lists
+REPORT_IMPORTS = 25
+
+_profiler = None
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.phases = []
+        self.imports = {}
+        self.stack = []
+
+    def install_import_hook(self):
+        """Time every first import made on the main thread, inclusive and self."""
+        original = builtins.__import__
+        main_thread = threading.main_thread()
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules or threading.current_thread() is not main_thread:
+                return original(name, globals, locals, fromlist, level)
+            start = time.perf_counter()
+            self.stack.append(0.0)
+            try:
+                return original(name, globals, locals, fromlist, level)
+            finally:
+                elapsed = time.perf_counter() - start
+                children = self.stack.pop()
+                if self.stack:
+                    self.stack[-1] += elapsed
+                self.imports.setdefault(name, (elapsed, elapsed - children))
+
+        builtins.__import__ = timed_import
+
+    def checkpoint(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def report(self):
+        lines = ["Startup profile", "Phases:"]
+        total = 0.0
+        for name, seconds in self.phases:
+            total += seconds
+            lines.append(f"  {name:<24} {seconds * 1000:8.1f} ms   (at {total * 1000:8.1f} ms)")
+        lines.append(f"Slowest imports (inclusive / self), {len(self.imports)} modules timed:")
+        slowest = sorted(self.imports.items(), key=lambda item: item[1][0], reverse=True)
+        for name, (inclusive, own) in slowest[:REPORT_IMPORTS]:
+            lines.append(f"  {name:<40} {inclusive * 1000:8.1f} ms {own * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+def requested(argv=None):
+    argv = sys.argv if argv is None else argv
+    return '--profile-startup' in argv or bool(os.environ.get('YTDL_PROFILE_STARTUP'))
+
+
+def enable_if_requested(argv=None):
+    """Start profiling if asked for on the command line or in the environment."""
+    global _profiler
+    if _profiler is None and requested(argv):
+        _profiler = StartupProfiler()
+        _profiler.install_import_hook()
+    return _profiler
+
+
+def checkpoint(name):
+    """End the current phase as ``name``; does nothing unless profiling is enabled."""
+    if _profiler is not None:
+        _profiler.checkpoint(name)
+
+
+def report(path=None):
+    """Print the profile and also write it to ``path``; returns the text, or None if disabled."""
+    if _profiler is None:
+        return None
+    text = _profiler.report()
+    print(text)
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    return text
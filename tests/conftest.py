@@ -0,0 +1,33 @@
+import os
+import sys
+import http.server
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start a fixture server over ``tmp_path`` and return its base URL.
+
+    Call it as ``serve(handler_class)`` to use a ``benchmark.FixtureHandler``
+    subclass; files are served from ``tmp_path`` at ``/videoplayback/<name>``.
+    """
+    servers = []
+
+    def start(handler=benchmark.FixtureHandler):
+        handler = type('Handler', (handler,), {'media_dir': str(tmp_path)})
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/videoplayback"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
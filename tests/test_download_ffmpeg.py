@@ -0,0 +1,126 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import download_ffmpeg
+import http_client
+
+BINARY = os.urandom(50_000) + b'ffmpeg' * 20_000
+OTHER = b'readme ' * 1000
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream, so ``zipfile`` has to write data descriptors."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def build_zip(compression, descriptors=False, name='ffmpeg'):
+    out = Unseekable() if descriptors else io.BytesIO()
+    with zipfile.ZipFile(out, 'w', compression=compression) as zf:
+        zf.writestr('ffmpeg-7.0/README.txt', OTHER)
+        zf.writestr('ffmpeg-7.0/bin/', b'')
+        zf.writestr(f'ffmpeg-7.0/bin/{name}', BINARY)
+        zf.writestr('ffmpeg-7.0/bin/ffprobe', OTHER)
+    return (out.buffer if descriptors else out).getvalue()
+
+
+def build_tar_xz(name='ffmpeg'):
+    out = io.BytesIO()
+    with tarfile.open(fileobj=out, mode='w:xz') as tar:
+        for member_name, data in (('ffmpeg-7.0/README.txt', OTHER),
+                                  (f'ffmpeg-7.0/{name}', BINARY),
+                                  ('ffmpeg-7.0/ffprobe', OTHER)):
+            info = tarfile.TarInfo(member_name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return out.getvalue()
+
+
+def corrupt_crc(data, entry_name):
+    """Flip the CRC-32 in the local header of ``entry_name``."""
+    offset = data.index(entry_name.encode()) - download_ffmpeg.ZIP_LOCAL_HEADER.size
+    crc = bytes(b ^ 0xff for b in data[offset + 14:offset + 18])
+    return data[:offset + 14] + crc + data[offset + 18:]
+
+
+def install(tmp_path, serve, archive_name, data, kind):
+    (tmp_path / archive_name).write_bytes(data)
+    url = serve() + '/' + archive_name
+    ffmpeg_exe = str(tmp_path / 'bin' / 'ffmpeg')
+    os.makedirs(os.path.dirname(ffmpeg_exe), exist_ok=True)
+    return download_ffmpeg.install(
+        url, kind, 'ffmpeg', ffmpeg_exe, session=http_client.build_session()
+    )
+
+
+@pytest.mark.parametrize('compression, descriptors', [
+    (zipfile.ZIP_STORED, False),
+    (zipfile.ZIP_DEFLATED, False),
+    (zipfile.ZIP_DEFLATED, True),
+])
+def test_install_from_zip(tmp_path, serve, compression, descriptors):
+    data = build_zip(compression, descriptors)
+    assert (data[6] & 0x08 != 0) == descriptors
+
+    ffmpeg_exe = install(tmp_path, serve, 'ffmpeg.zip', data, 'zip')
+
+    with open(ffmpeg_exe, 'rb') as f:
+        assert f.read() == BINARY
+    assert os.access(ffmpeg_exe, os.X_OK)
+    assert not os.path.exists(ffmpeg_exe + '.part')
+    assert download_ffmpeg.is_installed(ffmpeg_exe)
+
+
+def test_install_from_tar_xz(tmp_path, serve):
+    ffmpeg_exe = install(tmp_path, serve, 'ffmpeg.tar.xz', build_tar_xz(), 'tar.xz')
+
+    with open(ffmpeg_exe, 'rb') as f:
+        assert f.read() == BINARY
+    assert download_ffmpeg.is_installed(ffmpeg_exe)
+
+
+def test_modified_binary_is_not_installed(tmp_path, serve):
+    ffmpeg_exe = install(tmp_path, serve, 'ffmpeg.tar.xz', build_tar_xz(), 'tar.xz')
+    with open(ffmpeg_exe, 'r+b') as f:
+        f.write(b'X')
+
+    assert not download_ffmpeg.is_installed(ffmpeg_exe)
+
+
+@pytest.mark.parametrize('compression', [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+def test_zip_crc_mismatch(tmp_path, serve, compression):
+    data = corrupt_crc(build_zip(compression), 'ffmpeg-7.0/bin/ffmpeg')
+
+    with pytest.raises(download_ffmpeg.BootstrapError, match='CRC mismatch'):
+        install(tmp_path, serve, 'ffmpeg.zip', data, 'zip')
+    assert os.listdir(tmp_path / 'bin') == []
+
+
+@pytest.mark.parametrize('archive_name, data, kind', [
+    ('ffmpeg.zip', build_zip(zipfile.ZIP_DEFLATED, name='ffmpeg-other'), 'zip'),
+    ('ffmpeg.zip', build_zip(zipfile.ZIP_DEFLATED, True, name='ffmpeg-other'), 'zip'),
+    ('ffmpeg.tar.xz', build_tar_xz(name='ffmpeg-other'), 'tar.xz'),
+])
+def test_binary_not_found(tmp_path, serve, archive_name, data, kind):
+    with pytest.raises(download_ffmpeg.BootstrapError, match='not found'):
+        install(tmp_path, serve, archive_name, data, kind)
+    assert os.listdir(tmp_path / 'bin') == []
+
+
+def test_stored_entry_with_descriptor_is_rejected(tmp_path, serve):
+    data = build_zip(zipfile.ZIP_STORED, descriptors=True)
+
+    with pytest.raises(download_ffmpeg.BootstrapError):
+        install(tmp_path, serve, 'ffmpeg.zip', data, 'zip')
+    assert os.listdir(tmp_path / 'bin') == []
@@ -0,0 +1,159 @@
+import os
+import time
+
+import pytest
+from pytubefix.exceptions import VideoUnavailable
+
+import job_queue
+from progress_bus import ProgressBus
+
+PLAYLIST = "https://www.youtube.com/playlist?list=PLtest"
+VIDEO = "https://www.youtube.com/watch?v=abcdefghijk"
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    queue = job_queue.JobQueue(str(tmp_path / 'jobs.sqlite3'))
+    yield queue
+    queue.conn.close()
+
+
+def touch(path):
+    with open(path, 'wb') as f:
+        f.write(b'partial')
+    return str(path)
+
+
+def state(queue, job_id):
+    return queue.conn.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+
+def test_recover_requeues_interrupted_jobs(tmp_path, jobs):
+    fetching = jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+    muxing = jobs.enqueue('playlist', PLAYLIST, str(tmp_path), 'mp4')
+    video_temp = touch(tmp_path / 'video_temp.mp4')
+    jobs.update(fetching, job_queue.FETCHING)
+    jobs.update(muxing, job_queue.MUXING, [video_temp])
+
+    assert jobs.recover() == 2
+    assert state(jobs, fetching) == state(jobs, muxing) == job_queue.QUEUED
+    # 重新排入的工作保留暫存檔供續傳
+    # Requeued jobs keep their temp files so the next attempt can resume
+    assert os.path.exists(video_temp)
+
+
+def test_recover_removes_temp_files_of_failed_jobs(tmp_path, jobs):
+    job_id = jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+    temp = touch(tmp_path / 'video_temp.mp4')
+    part = touch(tmp_path / 'audio_temp.mp4.part')
+    jobs.update(job_id, job_queue.FAILED, [temp, str(tmp_path / 'audio_temp.mp4')])
+
+    assert jobs.recover() == 0
+    assert not os.path.exists(temp) and not os.path.exists(part)
+    assert jobs.conn.execute("SELECT temp_files FROM jobs").fetchone()[0] == '[]'
+
+
+def test_claim_takes_videos_before_playlists(tmp_path, jobs):
+    playlist = jobs.enqueue('playlist', PLAYLIST, str(tmp_path), 'mp4')
+    first = jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+    second = jobs.enqueue('video', VIDEO, str(tmp_path), 'webm', '720p')
+
+    assert [jobs.claim(job_queue.KINDS)['id'] for _ in range(3)] == [first, second, playlist]
+    assert jobs.claim(job_queue.KINDS) is None
+    assert state(jobs, playlist) == job_queue.FETCHING
+
+
+def test_claim_only_takes_the_given_kinds(tmp_path, jobs):
+    playlist = jobs.enqueue('playlist', PLAYLIST, str(tmp_path), 'mp4')
+    jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+
+    assert jobs.claim(['playlist'])['id'] == playlist
+    assert jobs.claim([]) is None
+
+
+def test_fail_backs_off_then_gives_up(tmp_path, jobs):
+    job_id = jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+    temp = touch(tmp_path / 'video_temp.mp4')
+    delays = []
+    for attempt in range(1, job_queue.MAX_ATTEMPTS):
+        job = jobs.claim(job_queue.KINDS)
+        assert job['attempts'] == attempt
+        jobs.update(job_id, job_queue.FETCHING, [temp])
+        delays.append(jobs.fail(job_id, 'timed out'))
+        assert jobs.claim(job_queue.KINDS) is None
+        # 等待時間到了才能再次領取
+        # The job can be claimed again only once its delay has passed
+        jobs.conn.execute("UPDATE jobs SET next_attempt_at = ?", (time.time(),))
+        assert os.path.exists(temp)
+
+    for attempt, delay in enumerate(delays, 1):
+        base = min(job_queue.RETRY_BASE * 2 ** (attempt - 1), job_queue.RETRY_MAX)
+        assert 0.8 * base <= delay <= 1.2 * base
+
+    jobs.claim(job_queue.KINDS)
+    assert jobs.fail(job_id, 'timed out') is None
+    assert state(jobs, job_id) == job_queue.FAILED
+    assert not os.path.exists(temp)
+
+
+def test_permanent_failure_is_not_retried(tmp_path, jobs):
+    job_id = jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+    temp = touch(tmp_path / 'video_temp.mp4')
+    jobs.claim(job_queue.KINDS)
+    jobs.update(job_id, job_queue.FETCHING, [temp])
+
+    assert jobs.fail(job_id, 'video unavailable', retry=False) is None
+    assert state(jobs, job_id) == job_queue.FAILED
+    assert not os.path.exists(temp)
+
+
+class FakeMetadata:
+    def invalidate(self, video_id):
+        pass
+
+
+class FakeEngine:
+    """Stands in for ``DownloadEngine``; every download ends with ``outcome``."""
+
+    def __init__(self, outcome):
+        self.bus = ProgressBus()
+        self.metadata = FakeMetadata()
+        self.outcome = outcome
+
+    def download_single_video(self, *args, **kwargs):
+        raise self.outcome
+
+    def download_playlist(self, *args, **kwargs):
+        return self.outcome
+
+
+def run_claimed(runner, jobs):
+    job = jobs.claim(job_queue.KINDS)
+    runner.running[job['kind']] += 1
+    runner.run(job)
+    return [e for e in runner.engine.bus.drain()[0] if e['kind'] == 'message']
+
+
+def test_unavailable_video_fails_without_retry(tmp_path, jobs):
+    runner = job_queue.QueueRunner(FakeEngine(VideoUnavailable('abcdefghijk')), jobs)
+    job_id = jobs.enqueue('video', VIDEO, str(tmp_path), 'mp4', '720p')
+
+    messages = run_claimed(runner, jobs)
+
+    assert state(jobs, job_id) == job_queue.FAILED
+    assert [e['level'] for e in messages] == ['error']
+
+
+@pytest.mark.parametrize('outcome, expected, retried', [
+    ((3, 0, 0), ('info', 'playlist_complete'), False),
+    ((2, 1, 1), ('warning', 'playlist_skipped'), False),
+    ((1, 2, 1), None, True),
+])
+def test_playlist_retries_only_transient_failures(tmp_path, jobs, outcome, expected, retried):
+    runner = job_queue.QueueRunner(FakeEngine(outcome), jobs)
+    job_id = jobs.enqueue('playlist', PLAYLIST, str(tmp_path), 'mp4')
+
+    messages = run_claimed(runner, jobs)
+
+    assert state(jobs, job_id) == (job_queue.QUEUED if retried else job_queue.DONE)
+    assert [(e['level'], e['key']) for e in messages] == ([] if retried else [expected])
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+import media_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = media_store.MediaStore(str(tmp_path / 'store'))
+    yield store
+    store.close()
+
+
+def write(path, data=b'video' * 1000):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def test_store_keeps_no_copy_of_its_own(tmp_path, store):
+    first = write(tmp_path / 'a' / '01_title.mp4')
+    store.add('vid', 'mp4', 'best', first, 'title')
+
+    assert store.lookup('vid', 'mp4', 'best') == ('title', os.path.abspath(first))
+    assert all(name.startswith('store.sqlite3') for name in os.listdir(tmp_path / 'store'))
+    assert store.lookup('vid', 'webm', 'best') is None
+
+
+def test_place_hardlinks_from_an_existing_copy(tmp_path, store):
+    first = write(tmp_path / 'a' / '01_title.mp4')
+    store.add('vid', 'mp4', 'best', first, 'title')
+    second = str(tmp_path / 'b' / '05_title.mp4')
+    os.makedirs(os.path.dirname(second))
+
+    assert store.place('vid', 'mp4', 'best', 'title', first, second) == 'hardlink'
+    assert os.path.samefile(first, second)
+    assert not os.path.exists(second + '.store.tmp')
+
+
+def test_deleted_and_modified_copies_are_dropped(tmp_path, store):
+    first = write(tmp_path / 'a' / '01_title.mp4')
+    second = write(tmp_path / 'b' / '05_title.mp4')
+    store.add('vid', 'mp4', 'best', first, 'title')
+    store.add('vid', 'mp4', 'best', second, 'title')
+
+    os.remove(first)
+    assert store.lookup('vid', 'mp4', 'best') == ('title', os.path.abspath(second))
+
+    write(second, b'changed')
+    assert store.lookup('vid', 'mp4', 'best') is None
+    assert store.collect() == 0
+
+
+def test_collect_drops_deleted_files(tmp_path, store):
+    paths = [write(tmp_path / folder / '01_title.mp4') for folder in 'abc']
+    for path in paths:
+        store.add('vid', 'mp4', 'best', path, 'title')
+    os.remove(paths[0])
+    os.remove(paths[1])
+
+    assert store.collect() == 2
+    assert store.lookup('vid', 'mp4', 'best') == ('title', os.path.abspath(paths[2]))
+
+
+def test_place_falls_back_to_a_copy(tmp_path, monkeypatch):
+    src = write(tmp_path / 'a' / 'video.mp4')
+    dst = str(tmp_path / 'b' / 'video.mp4')
+    os.makedirs(os.path.dirname(dst))
+
+    def cross_device(*args):
+        raise OSError("cross-device link")
+
+    monkeypatch.setattr(os, 'link', cross_device)
+    monkeypatch.setattr(media_store, 'reflink', cross_device)
+
+    assert media_store.place_file(src, dst) == 'copy'
+    with open(src, 'rb') as a, open(dst, 'rb') as b:
+        assert a.read() == b.read()
+    assert not os.path.samefile(src, dst)
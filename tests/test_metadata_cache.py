@@ -0,0 +1,32 @@
+import time
+import threading
+
+import metadata_cache
+
+
+def test_concurrent_stores_and_evictions(tmp_path):
+    cache = metadata_cache.MetadataCache(str(tmp_path), max_entries=5)
+    errors = []
+
+    def work(worker):
+        for i in range(200):
+            video_id = f"v{(worker * 7 + i) % 40:010d}"
+            try:
+                cache.store(metadata_cache.VideoInfo(video_id, 'title', 'url', [], time.time() + 3600))
+                with cache.lock:
+                    cache.entries.pop(video_id, None)
+                cache.lookup(video_id)
+                if i % 13 == 0:
+                    cache.invalidate(video_id)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len([p for p in tmp_path.iterdir() if p.suffix == '.json']) <= 5 + len(threads)
+    assert not [p for p in tmp_path.iterdir() if p.suffix == '.tmp']
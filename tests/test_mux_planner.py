@@ -0,0 +1,50 @@
+from metadata_cache import CachedStream, StreamTable
+from mux_planner import choose_audio, plan_mux
+
+H264 = CachedStream(itag=137, type='video', subtype='mp4', resolution='1080p',
+                    video_codec='avc1.640028', is_progressive=False)
+VP9 = CachedStream(itag=248, type='video', subtype='webm', resolution='1080p',
+                   video_codec='vp9', is_progressive=False)
+AAC = CachedStream(itag=140, type='audio', subtype='mp4', abr='128kbps',
+                   audio_codec='mp4a.40.2', is_progressive=False)
+OPUS = CachedStream(itag=251, type='audio', subtype='webm', abr='160kbps',
+                    audio_codec='opus', is_progressive=False)
+LOW_OPUS = CachedStream(itag=250, type='audio', subtype='webm', abr='70kbps',
+                        audio_codec='opus', is_progressive=False)
+
+
+def streams(*items):
+    return StreamTable([H264, VP9, *items])
+
+
+def codec_args(args):
+    return args[args.index('1:a:0') + 1:-2]
+
+
+def test_aac_into_mp4_is_a_plain_copy():
+    audio = choose_audio(streams(AAC, OPUS), 'mp4')
+    assert audio is AAC
+
+    args = plan_mux(H264, audio, 'v.mp4', 'a.mp4', 'out.mp4', 'mp4')
+    assert args[:4] == ['-i', 'v.mp4', '-i', 'a.mp4']
+    assert codec_args(args) == ['-c', 'copy']
+    assert args[-2:] == ['-y', 'out.mp4']
+
+
+def test_webm_prefers_opus_over_aac():
+    # AAC 位元率較高，但 webm 能直接複製 opus
+    # AAC has the higher bitrate here, but webm can copy opus as it is
+    high_aac = CachedStream(itag=141, type='audio', subtype='mp4', abr='256kbps',
+                            audio_codec='mp4a.40.2', is_progressive=False)
+    assert choose_audio(streams(high_aac, LOW_OPUS, OPUS), 'webm') is OPUS
+
+    args = plan_mux(VP9, OPUS, 'v.webm', 'a.webm', 'out.webm', 'webm')
+    assert codec_args(args) == ['-c', 'copy']
+
+
+def test_webm_with_only_aac_transcodes_the_audio():
+    audio = choose_audio(streams(AAC), 'webm')
+    assert audio is AAC
+
+    args = plan_mux(VP9, audio, 'v.webm', 'a.mp4', 'out.webm', 'webm')
+    assert codec_args(args) == ['-c:v', 'copy', '-c:a', 'libopus', '-b:a', '160k']
@@ -0,0 +1,167 @@
+import os
+import json
+
+import pytest
+
+import benchmark
+import http_client
+import segmented_download
+
+SIZE = 200_003
+SEGMENT = 16 * 1024
+
+
+class RecordingHandler(benchmark.FixtureHandler):
+    """Remembers the Range header of every request."""
+
+    ranges = None
+
+    def do_GET(self):
+        self.ranges.append(self.headers.get('Range'))
+        super().do_GET()
+
+
+class NoRangeHandler(RecordingHandler):
+    """A server without Range support: always answers 200 with the whole file."""
+
+    def do_GET(self):
+        del self.headers['Range']
+        super().do_GET()
+
+
+class ShortSegmentHandler(RecordingHandler):
+    """Answers the first request for the segment at ``cut`` with 100 bytes, then serves normally."""
+
+    cut = None
+
+    def do_GET(self):
+        value = self.headers.get('Range', '')
+        if self.cut and value.startswith(f"bytes={self.cut}-"):
+            self.ranges.append(value)
+            type(self).cut = None
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {value[6:]}/{SIZE}")
+            self.send_header('Content-Length', '100')
+            self.end_headers()
+            self.wfile.write(b'\0' * 100)
+            return
+        super().do_GET()
+
+
+@pytest.fixture
+def source(tmp_path):
+    data = os.urandom(SIZE)
+    (tmp_path / 'stream.bin').write_bytes(data)
+    return data
+
+
+def handler(base, **attrs):
+    return type('Handler', (base,), {'ranges': [], **attrs})
+
+
+def segment_requests(h):
+    return [value for value in h.ranges if value and value != 'bytes=0-0']
+
+
+def test_split_segments_cover_the_file():
+    segments = segmented_download.split_segments(SIZE, SEGMENT)
+    assert segments[0] == (0, SEGMENT - 1)
+    assert segments[-1][1] == SIZE - 1
+    assert sum(end - start + 1 for start, end in segments) == SIZE
+    assert all(b[0] == a[1] + 1 for a, b in zip(segments, segments[1:]))
+
+
+def test_segmented_download(tmp_path, source, serve):
+    h = handler(RecordingHandler)
+    url = serve(h) + '/stream.bin'
+    dest = str(tmp_path / 'out' / 'video.mp4')
+    os.makedirs(os.path.dirname(dest))
+    progress = []
+
+    segmented_download.download(
+        url, dest, connections=4, segment_size=SEGMENT,
+        on_progress=lambda done, total: progress.append((done, total)),
+        session=http_client.build_session()
+    )
+
+    with open(dest, 'rb') as f:
+        assert f.read() == source
+    assert not any(os.path.exists(p) for p in segmented_download.part_paths(dest))
+    assert len(segment_requests(h)) == len(segmented_download.split_segments(SIZE, SEGMENT))
+    assert max(progress) == (SIZE, SIZE)
+
+
+def test_interrupted_download_resumes_from_manifest(tmp_path, source, serve):
+    h = handler(RecordingHandler)
+    url = serve(h) + '/stream.bin'
+    dest = str(tmp_path / 'video.mp4')
+    part_path, manifest_path = segmented_download.part_paths(dest)
+    seen = {'bytes': 0}
+
+    def interrupt(n):
+        seen['bytes'] += n
+        if seen['bytes'] > 3 * SEGMENT:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        segmented_download.download(
+            url, dest, connections=1, segment_size=SEGMENT, throttle=interrupt,
+            session=http_client.build_session()
+        )
+    assert not os.path.exists(dest)
+    with open(manifest_path, encoding='utf-8') as f:
+        done = json.load(f)['done']
+    assert done == [0, SEGMENT, 2 * SEGMENT]
+
+    h.ranges.clear()
+    segmented_download.download(
+        url, dest, connections=2, segment_size=SEGMENT, session=http_client.build_session()
+    )
+    with open(dest, 'rb') as f:
+        assert f.read() == source
+    fetched = segment_requests(h)
+    assert len(fetched) == len(segmented_download.split_segments(SIZE, SEGMENT)) - 3
+    assert not any(value.startswith(f"bytes={start}-") for value in fetched for start in done)
+    assert not os.path.exists(part_path) and not os.path.exists(manifest_path)
+
+
+def test_server_without_range_falls_back_to_single_get(tmp_path, source, serve):
+    h = handler(NoRangeHandler)
+    url = serve(h) + '/stream.bin'
+    dest = str(tmp_path / 'video.mp4')
+
+    segmented_download.download(
+        url, dest, segment_size=SEGMENT, session=http_client.build_session()
+    )
+
+    with open(dest, 'rb') as f:
+        assert f.read() == source
+    assert len(h.ranges) == 2
+    assert not any(os.path.exists(p) for p in segmented_download.part_paths(dest))
+
+
+def test_short_segment_is_retried(tmp_path, source, serve):
+    h = handler(ShortSegmentHandler, cut=2 * SEGMENT)
+    url = serve(h) + '/stream.bin'
+    dest = str(tmp_path / 'video.mp4')
+    progress = []
+
+    segmented_download.download(
+        url, dest, connections=2, segment_size=SEGMENT,
+        on_progress=lambda done, total: progress.append(done),
+        session=http_client.build_session()
+    )
+
+    with open(dest, 'rb') as f:
+        assert f.read() == source
+    cut = [value for value in h.ranges if value and value.startswith(f"bytes={2 * SEGMENT}-")]
+    assert len(cut) == 2
+    assert max(progress) == SIZE
+
+
+def test_iter_content_yields_the_body_in_order(source, serve):
+    url = serve(handler(RecordingHandler)) + '/stream.bin'
+    chunks = segmented_download.iter_content(
+        url, segment_size=SEGMENT, session=http_client.build_session()
+    )
+    assert b''.join(chunks) == source
@@ -0,0 +1,112 @@
+import os
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import http_client
+
+THUMBNAIL_SIZE = (320, 180)
+DEFAULT_MAX_MEMORY_ENTRIES = 64
+DEFAULT_MAX_DISK_BYTES = 32 * 1024 * 1024
+
+
+class ThumbnailCache:
+    """Resized thumbnails, fetched and decoded off the Tk thread.
+
+    Images are kept already resized to ``THUMBNAIL_SIZE``: the newest
+    ``max_memory_entries`` in memory, and up to ``max_disk_bytes`` of JPEGs under
+    ``cache_dir``. Only turning an image into a ``PhotoImage`` is left to the
+    caller, since that has to happen on the Tk thread.
+    """
+
+    def __init__(self, cache_dir, max_memory_entries=DEFAULT_MAX_MEMORY_ENTRIES,
+                 max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='thumbnail')
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cached(self, key):
+        """Return the in-memory image for ``key`` without blocking, or None."""
+        with self.lock:
+            image = self.memory.get(key)
+            if image is not None:
+                self.memory.move_to_end(key)
+            return image
+
+    def submit(self, key, resolve_url):
+        """Load ``key`` in the background and return a Future for the PIL image.
+
+        ``resolve_url`` is only called, on the worker, when neither cache layer
+        has the image, so metadata lookups stay off the caller's thread too.
+        """
+        return self.pool.submit(self.load, key, resolve_url)
+
+    def load(self, key, resolve_url):
+        image = self.cached(key)
+        if image is not None:
+            return image
+        image = self.load_from_disk(key)
+        if image is None:
+            response = http_client.session().get(resolve_url())
+            response.raise_for_status()
+            image = Image.open(BytesIO(response.content)).convert('RGB').resize(THUMBNAIL_SIZE)
+            self.save_to_disk(key, image)
+        with self.lock:
+            self.memory[key] = image
+            while len(self.memory) > self.max_memory_entries:
+                self.memory.popitem(last=False)
+        return image
+
+    def load_from_disk(self, key):
+        path = self.path_for(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with Image.open(path) as img:
+                image = img.convert('RGB')
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return image
+
+    def save_to_disk(self, key, image):
+        path = self.path_for(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format='JPEG', quality=90)
+        os.replace(tmp_path, path)
+        self.evict_disk()
+
+    def evict_disk(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.jpg'):
+                path = os.path.join(self.cache_dir, name)
+                # 另一個工作執行緒可能剛刪掉這個檔案
+                # The other worker may have just removed this file
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def path_for(self, key):
+        return os.path.join(self.cache_dir, f"{key}.jpg")